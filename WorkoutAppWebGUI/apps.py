@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WorkoutappwebguiConfig(AppConfig):
     name = 'WorkoutAppWebGUI'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,100 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.shortcuts import reverse
+from django.test import Client
+
+from .charts import chart_key, get_one_rep_max_series, invalidate_series
+from .ml import Predictor, quick_predict, populate_predictions
+from .models import Workout, WAUser
+from .programs import get_program_day
+from .views import plot
+
+# Metrics compared against the baseline, lower is better for all of them.
+METRICS = ['median_ms', 'peak_kib']
+
+
+def measure(func, setup=None, repeat=5):
+    """Time repeat calls of func and trace the peak memory of one more.
+
+    Memory is traced on a separate call because tracemalloc slows down the
+    code it watches.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'peak_kib': peak / 1024}
+
+
+def get_benchmarks(user_id=None):
+    """Mapping of benchmark name to (setup, func) for the user with the longest history."""
+    users = WAUser.objects.select_related('auth_user')
+    if user_id is None:
+        user = users.annotate(workouts=Count('workout')).order_by('-workouts', 'user_id').first()
+        user_id = user.pk
+    else:
+        user = users.get(pk=user_id)
+    workout = Workout.objects.filter(user_id=user_id, expected__isnull=False).order_by('-workout_id').first()
+    day = get_program_day(workout.expected_id)
+    series = get_one_rep_max_series(user_id)
+    client = Client()
+    client.force_login(user.auth_user)
+
+    def drop_chart():
+        cache.delete(chart_key(user_id))
+
+    def drop_series():
+        invalidate_series([user_id])
+
+    def landing():
+        response = client.get(reverse('landing'))
+        if response.status_code != 200:
+            raise RuntimeError(f'landing returned {response.status_code}')
+
+    return {
+        'predictor_predict': (None, lambda: Predictor(day, user_id).predict()),
+        'quick_predict': (None, lambda: quick_predict(workout.pk)),
+        'populate_predictions': (None, lambda: populate_predictions(workout.pk)),
+        'plot': (None, lambda: plot(series)),
+        'landing': (None, landing),
+        'landing_cold_chart': (drop_chart, landing),
+        'landing_cold_series': (drop_series, landing),
+    }
+
+
+def run_benchmarks(repeat=5, names=None, user_id=None):
+    results = {}
+    for name, (setup, func) in get_benchmarks(user_id).items():
+        if names and name not in names:
+            continue
+        func()  # warm up imports, model loading and caches
+        results[name] = measure(func, setup, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Rows of (name, metric, baseline, current, ratio, regressed) for every metric present in both."""
+    rows = []
+    for name, current in results.items():
+        for metric in METRICS:
+            before = baseline.get(name, {}).get(metric)
+            if before is None:
+                continue
+            ratio = current[metric] / before if before else float('inf')
+            rows.append((name, metric, before, current[metric], ratio, ratio > 1 + tolerance))
+    return rows
@@ -0,0 +1,80 @@
+import threading
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import ExerciseType
+
+CatalogEntry = namedtuple('CatalogEntry', ['exercise_id', 'name', 'weighted', 'weight_step'])
+
+VERSION_KEY = 'exercise_catalog_version'
+
+
+class ExerciseCatalog:
+    """Per process copy of the ExerciseType table.
+
+    The catalog is read several times per request but changes a few times a
+    month. The ExerciseType post_save/post_delete signals (see signals.py)
+    replace a version stamp kept in the cache, which settings.CACHES shares
+    between processes, and every process reloads when it sees a new stamp.
+    The stamp is read once per request (see start_request), and on every
+    lookup outside requests, e.g. in the job worker.
+    """
+
+    def __init__(self):
+        self._loaded = None
+        self._lock = threading.Lock()
+        self._request = threading.local()
+
+    def version(self):
+        """The current version stamp, a new one if it was lost from the cache."""
+        version = getattr(self._request, 'version', None)
+        if version is None:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                # Evicted or cleared, a fresh stamp makes sure no process keeps what it loaded before.
+                cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+                version = cache.get(VERSION_KEY)
+            if getattr(self._request, 'active', False):
+                self._request.version = version
+        return version
+
+    def start_request(self):
+        self._request.active = True
+        self._request.version = None
+
+    def finish_request(self):
+        self._request.active = False
+        self._request.version = None
+
+    def entries(self):
+        """Mapping of exercise id to CatalogEntry."""
+        version = self.version()
+        loaded = self._loaded
+        if loaded is None or loaded[0] != version:
+            with self._lock:
+                entries = {ex.exercise_id: CatalogEntry(ex.exercise_id, ex.name, ex.weighted, ex.weight_step)
+                           for ex in ExerciseType.objects.order_by('exercise_id')}
+                loaded = self._loaded = (version, entries)
+        return loaded[1]
+
+    def get(self, exercise_id):
+        return self.entries()[exercise_id]
+
+    def instance(self, exercise_id):
+        """Fresh ExerciseType built from the catalog, without a query."""
+        return ExerciseType(**self.get(exercise_id)._asdict())
+
+    def choices(self):
+        return [(entry.exercise_id, entry.name) for entry in self.entries().values()]
+
+    def invalidate(self):
+        self._loaded = None
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, None)
+        if getattr(self._request, 'active', False):
+            self._request.version = version
+
+
+catalog = ExerciseCatalog()
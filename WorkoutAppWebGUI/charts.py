@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from .models import ExerciseSummary, Workout
+
+SERIES_COLUMNS = ['workout__date', 'exercise_id', 'exercise__name', 'one-rep-max']
+
+# Part of the chart cache keys, bump it when views.plot() changes the markup.
+CHART_VERSION = 1
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def series_key(user_id):
+    return f'one_rep_max_series:{user_id}'
+
+
+def chart_key(user_id):
+    return f'one_rep_max_chart:{CHART_VERSION}:{user_id}'
+
+
+def get_last_workout_id(user_id):
+    return Workout.objects.filter(user_id=user_id).aggregate(last=Max('workout_id'))['last']
+
+
+def get_one_rep_max_series(user_id, last_workout_id=None):
+    """Return the user's estimated one rep max history, ordered by date.
+
+    The series is cached per user together with the id of the last workout it
+    covers. Only workouts logged after that id are read and appended on a
+    partial hit; anything else (e.g. a deleted workout) rebuilds the series.
+    Pass the user's last workout id if it is already known.
+    """
+    if last_workout_id is None:
+        last_workout_id = get_last_workout_id(user_id)
+    cached = cache.get(series_key(user_id))
+    if cached is not None and cached['last_workout_id'] == last_workout_id:
+        return cached['data']
+    # A series cached before the user's first workout has no last id, it is rebuilt.
+    if cached is not None and None not in (cached['last_workout_id'], last_workout_id) \
+            and cached['last_workout_id'] < last_workout_id:
+        data = append_rows(cached['data'], load_rows(user_id, after=cached['last_workout_id']))
+    else:
+        data = load_rows(user_id)
+    cache.set(series_key(user_id), {'last_workout_id': last_workout_id, 'data': data}, None)
+    return data
+
+
+def append_workout(user_id, workout_id):
+    """Extend an already cached series with a freshly logged workout."""
+    cached = cache.get(series_key(user_id))
+    if cached is None or cached['last_workout_id'] is None or cached['last_workout_id'] >= workout_id:
+        return
+    data = append_rows(cached['data'], load_rows(user_id, after=cached['last_workout_id'], upto=workout_id))
+    cache.set(series_key(user_id), {'last_workout_id': workout_id, 'data': data}, None)
+
+
+def get_one_rep_max_chart(user_id, render):
+    """render(series) of the user's series, cached per user until the next workout.
+
+    render is views.plot, whose (script, div) pair only depends on the
+    exercises in the series: the points are fetched by the page. A hit
+    costs one query and skips both the series and the bokeh serialisation.
+    """
+    last_workout_id = get_last_workout_id(user_id)
+    cached = cache.get(chart_key(user_id))
+    if cached is not None and cached['last_workout_id'] == last_workout_id:
+        return cached['chart']
+    chart = render(get_one_rep_max_series(user_id, last_workout_id))
+    cache.set(chart_key(user_id), {'last_workout_id': last_workout_id, 'chart': chart}, None)
+    return chart
+
+
+def invalidate_series(user_ids):
+    cache.delete_many([key for user_id in user_ids for key in [series_key(user_id), chart_key(user_id)]])
+
+
+def load_rows(user_id, after=None, upto=None):
+    import pandas
+    rows = ExerciseSummary.objects.filter(user_id=user_id)
+    if after is not None:
+        rows = rows.filter(workout_id__gt=after)
+    if upto is not None:
+        rows = rows.filter(workout_id__lte=upto)
+    rows = rows.order_by('date', 'workout_id').values_list('date', 'exercise_id', 'exercise__name', 'one_rep_max')
+    data = pandas.DataFrame.from_records(list(rows), columns=SERIES_COLUMNS)
+    # utc=True keeps the column timezone aware when it is empty or all undated, as append_rows compares it.
+    data['workout__date'] = pandas.to_datetime(data['workout__date'], utc=True)
+    return data
+
+
+def append_rows(data, rows):
+    import pandas
+    if rows.empty:
+        return data
+    backdated = not data.empty and rows['workout__date'].min() < data['workout__date'].max()
+    data = pandas.concat([data, rows], ignore_index=True)
+    if backdated:
+        # A workout logged for an earlier date, keep the series in date order.
+        data = data.sort_values('workout__date', kind='mergesort', ignore_index=True)
+    return data
+
+
+def exercise_menu(data):
+    """(exercise id, name) pairs of the exercises present in a series, in first logged order."""
+    exercises = data[['exercise_id', 'exercise__name']].drop_duplicates('exercise_id')
+    return [(str(exercise_id), name) for exercise_id, name in exercises.itertuples(index=False)]
+
+
+def exercise_rows(user_id, exercise_id, start=None, end=None):
+    """Dated summary rows of one exercise of the user in [start, end), in date order."""
+    rows = ExerciseSummary.objects.filter(user_id=user_id, exercise_id=exercise_id)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lt=end)
+    if start is None and end is None:
+        # A bound already leaves out the undated rows, IS NOT NULL next to one steers SQLite to summary_user_date_idx.
+        rows = rows.filter(date__isnull=False)
+    return rows.order_by('date', 'workout_id')
+
+
+def exercise_series(user_id, exercise_id, start=None, end=None):
+    """Dates (ms since epoch, as bokeh expects) and estimates of one exercise, in [start, end).
+
+    Read straight from the summary rows of that exercise rather than the
+    cached series of all of them.
+    """
+    rows = list(exercise_rows(user_id, exercise_id, start, end).values_list('date', 'one_rep_max'))
+    return {'x': [(date - EPOCH) // timedelta(milliseconds=1) for date, _ in rows],
+            'y': [one_rep_max for _, one_rep_max in rows]}
@@ -0,0 +1,98 @@
+import csv
+import json
+
+from .models import UserWeight, Workout
+
+EXPORT_CHUNK_SIZE = 2000
+
+# One flat record per workout, logged set and body weight entry. Fields a
+# record type does not have are left empty (CSV) or null (NDJSON).
+COLUMNS = ['record', 'workout_id', 'date', 'program', 'day', 'complete', 'set_number', 'exercise', 'reps',
+           'weight', 'rpe', 'unit', 'seq_num']
+
+WORKOUT_FIELDS = ['workout_id', 'date', 'expected__program__program_name', 'expected__day_name', 'complete',
+                  'set__set_id', 'set__set_number', 'set__exercise__name', 'set__reps', 'set__weight', 'set__rpe',
+                  'set__unit__label']
+
+
+def make_record(record, **fields):
+    row = dict.fromkeys(COLUMNS)
+    row['record'] = record
+    row.update(fields)
+    return row
+
+
+def export_records(user_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the user's history as dicts keyed by COLUMNS, workouts (each followed by its sets) then body weights.
+
+    Rows are read with iterator(), a server side cursor on PostgreSQL, so
+    memory stays bounded by chunk_size whatever the length of the history.
+    """
+    # The reverse join keeps workouts without sets, as one row with empty set fields.
+    rows = Workout.objects.filter(user_id=user_id) \
+        .order_by('date', 'workout_id', 'set__set_number', 'set__set_id') \
+        .values_list(*WORKOUT_FIELDS) \
+        .iterator(chunk_size=chunk_size)
+    current = None
+    for workout_id, date, program, day, complete, set_id, set_number, exercise, reps, weight, rpe, unit in rows:
+        date = date.isoformat() if date is not None else None
+        if workout_id != current:
+            current = workout_id
+            yield make_record('workout', workout_id=workout_id, date=date, program=program, day=day,
+                              complete=complete)
+        if set_id is not None:
+            yield make_record('set', workout_id=workout_id, date=date, set_number=set_number, exercise=exercise,
+                              reps=reps, weight=weight, rpe=rpe, unit=unit)
+
+    weights = UserWeight.objects.filter(user_id=user_id) \
+        .order_by('seq_num', 'weight_id') \
+        .values_list('date', 'weight', 'weight_unit__label', 'seq_num') \
+        .iterator(chunk_size=chunk_size)
+    for date, weight, unit, seq_num in weights:
+        yield make_record('bodyweight', date=date.isoformat() if date is not None else None, weight=weight,
+                          unit=unit, seq_num=seq_num)
+
+
+class Echo:
+    """File like object whose write returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    lines = []
+    for record in records:
+        lines.append(writer.writerow([record[column] for column in COLUMNS]))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def ndjson_lines(records, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = []
+    for record in records:
+        # Decimal weights and RPEs become JSON numbers.
+        lines.append(json.dumps(record, default=float) + '\n')
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+# Format name: (writer, content type)
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def stream_history(user_id, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iterator of text blocks of the user's history in one of FORMATS."""
+    lines, _ = FORMATS[fmt]
+    return lines(export_records(user_id, chunk_size), chunk_size)
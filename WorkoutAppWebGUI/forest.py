@@ -0,0 +1,124 @@
+import numpy
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into plain NumPy arrays.
+
+    All trees share one set of node arrays. Nodes are renumbered so that the
+    right child of a split always follows its left child and leaves point to
+    themselves with an infinite threshold, which lets a batch of rows walk
+    every tree at once with one gather-and-compare per level:
+
+        node = left[node] + (x[feature[node]] > threshold[node])
+
+    The arithmetic follows sklearn's: inputs are cast to float32 and compared
+    with the float64 thresholds, leaf class weights are normalised per tree
+    and the trees' probabilities are summed in order before averaging, so
+    predict() returns exactly what the sklearn model does. Loading one needs
+    NumPy only.
+    """
+
+    ARRAYS = ['feature', 'threshold', 'left', 'value', 'roots', 'classes']
+
+    def __init__(self, feature, threshold, left, value, roots, classes, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def compile(cls, model):
+        """Flatten a fitted single output RandomForestClassifier."""
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError('Only single output forests can be compiled')
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            feature, threshold, left, value = cls.flatten_tree(estimator.tree_, model.n_classes_)
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left + offset)
+            values.append(value)
+            roots.append(offset)
+            offset += len(feature)
+        n_features = model.n_features_in_ if hasattr(model, 'n_features_in_') else model.n_features_
+        return cls(numpy.concatenate(features), numpy.concatenate(thresholds), numpy.concatenate(lefts),
+                   numpy.concatenate(values), numpy.array(roots, dtype=numpy.int32), numpy.asarray(model.classes_),
+                   max(estimator.tree_.max_depth for estimator in model.estimators_), n_features)
+
+    @staticmethod
+    def flatten_tree(tree, n_classes):
+        """Renumber a sklearn tree breadth first with the two children of a split next to each other."""
+        order = [0]
+        new_left = {}
+        for node in order:
+            if tree.children_left[node] != -1:
+                new_left[node] = len(order)
+                order.extend([tree.children_left[node], tree.children_right[node]])
+        order = numpy.array(order)
+        is_leaf = tree.children_left[order] == -1
+        feature = numpy.where(is_leaf, 0, tree.feature[order]).astype(numpy.int32)
+        threshold = numpy.where(is_leaf, numpy.inf, tree.threshold[order]).astype(numpy.float64)
+        left = numpy.array([new_left.get(node, i) for i, node in enumerate(order)], dtype=numpy.int32)
+        # DecisionTreeClassifier.predict_proba
+        value = tree.value[order, 0, :n_classes].astype(numpy.float64)
+        normalizer = value.sum(axis=1)[:, numpy.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        return feature, threshold, left, value / normalizer
+
+    def save(self, path):
+        numpy.savez_compressed(path, max_depth=self.max_depth, n_features=self.n_features,
+                               **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, file):
+        with numpy.load(file, allow_pickle=False) as data:
+            return cls(*[data[name] for name in cls.ARRAYS], data['max_depth'], data['n_features'])
+
+    def apply(self, X):
+        """Leaf (global node index) of every tree and row, shape (n_trees, n_rows)."""
+        row_offsets = numpy.arange(len(X)) * self.n_features
+        X = X.ravel()
+        nodes = numpy.repeat(self.roots[:, numpy.newaxis], len(row_offsets), axis=1)
+        for _ in range(self.max_depth):
+            values = X.take(self.feature.take(nodes) + row_offsets)
+            nodes = self.left.take(nodes) + (values > self.threshold.take(nodes))
+        return nodes
+
+    def predict_proba(self, X):
+        X = self.validate(X)
+        proba = numpy.zeros((len(X), len(self.classes)))
+        for leaves in self.apply(X):
+            proba += self.value[leaves]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(numpy.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def validate(self, X):
+        X = numpy.ascontiguousarray(X, dtype=numpy.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f'Expected input of shape (n, {self.n_features}), got {X.shape}')
+        if not numpy.isfinite(X).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for dtype('float32').")
+        return X
+
+
+def sample_inputs(forest, rows, seed=0):
+    """Random rows for verification: values around and exactly on the split thresholds."""
+    rnd = numpy.random.default_rng(seed)
+    X = numpy.empty((rows, forest.n_features), dtype=numpy.float32)
+    splits = numpy.isfinite(forest.threshold)
+    for feature in range(forest.n_features):
+        thresholds = forest.threshold[splits & (forest.feature == feature)]
+        if not len(thresholds):
+            thresholds = numpy.zeros(1)
+        picked = rnd.choice(thresholds, rows)
+        jitter = rnd.choice([0, 0, 1], rows) * rnd.normal(0, 1 + numpy.abs(picked) * .05)
+        X[:, feature] = picked + jitter
+    return X
@@ -9,6 +9,50 @@ from .models import Prediction
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, Fieldset, Div, HTML, ButtonHolder, Submit
 from .layout import *
+from .catalog import catalog
+from .importer import READERS
+from .history import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, parse_cursor
+
+
+class CatalogChoices:
+    """Lazy choices of an ExerciseChoiceField, read from the exercise catalog on every render."""
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield '', self.field.empty_label
+        yield from catalog.choices()
+
+
+class ExerciseChoiceField(forms.ModelChoiceField):
+    """ExerciseType choice field rendered and validated from the catalog instead of the database"""
+    def __init__(self, **kwargs):
+        super(ExerciseChoiceField, self).__init__(queryset=ExerciseType.objects.all(), **kwargs)
+
+    def _get_choices(self):
+        return CatalogChoices(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return catalog.instance(int(value))
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class ExerciseSetForm(forms.ModelForm):
+    """Base form of the set formsets, one per row so the exercise choices must be cheap"""
+    exercise = ExerciseChoiceField()
+
+    def _get_validation_exclusions(self):
+        # ExerciseChoiceField already checked the exercise against the catalog, skip the per row existence query.
+        exclude = super(ExerciseSetForm, self)._get_validation_exclusions()
+        exclude.append('exercise')
+        return exclude
 
 
 class UserForm(forms.ModelForm):
@@ -51,6 +95,47 @@ class DaySelectorForm(forms.Form):
     day_selector = forms.ChoiceField()
 
 
+class ImportHistoryForm(forms.Form):
+    """Upload of a workout history file, see importer.py"""
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=[('', 'From the file name'), ('csv', 'CSV'), ('ndjson', 'NDJSON')],
+                               required=False)
+
+    def clean(self):
+        data = super(ImportHistoryForm, self).clean()
+        if data.get('file') is not None and not data.get('format'):
+            extension = data['file'].name.rsplit('.', 1)[-1].lower()
+            extension = {'jsonl': 'ndjson', 'json': 'ndjson'}.get(extension, extension)
+            data['format'] = extension
+            if extension not in READERS:
+                self.add_error('format', _('Choose the format, it cannot be told from the file name'))
+        return data
+
+
+class HistoryFilterForm(forms.Form):
+    """Filters and position of the workout history pages, read from the query string"""
+    day = forms.TypedChoiceField(coerce=int, empty_value=None, required=False)
+    exercise = forms.TypedChoiceField(coerce=int, empty_value=None, required=False)
+    after = forms.CharField(required=False, widget=forms.HiddenInput)
+    size = forms.IntegerField(min_value=1, max_value=HISTORY_MAX_PAGE_SIZE, required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, days=(), **kwargs):
+        super(HistoryFilterForm, self).__init__(*args, **kwargs)
+        self.fields['day'].choices = [('', 'All days')] + [(day.pk, f'{day.program} - {day}') for day in days]
+        self.fields['exercise'].choices = [('', 'All exercises')] + catalog.choices()
+
+    def clean_after(self):
+        if not self.cleaned_data['after']:
+            return None
+        try:
+            return parse_cursor(self.cleaned_data['after'])
+        except ValueError:
+            raise ValidationError(_('Invalid page cursor'))
+
+    def clean_size(self):
+        return self.cleaned_data['size'] or HISTORY_PAGE_SIZE
+
+
 class ProgramDayForm(forms.ModelForm):
     """Form for Program Day"""
     class Meta:
@@ -153,11 +238,12 @@ class PredictionForm(forms.ModelForm):
 
 
 SetFormSet = inlineformset_factory(
-    Workout, Set, fields=('exercise', 'reps', 'weight', 'rpe',), can_delete=False
+    Workout, Set, form=ExerciseSetForm, fields=('exercise', 'reps', 'weight', 'rpe',), can_delete=False
 )
 
 ExpectedSetFormset = inlineformset_factory(
-    ProgramDay, ExpectedSet, fields=('exercise', 'reps_min', 'reps_max', 'amrap', 'rpe'), extra=30, can_delete=False
+    ProgramDay, ExpectedSet, form=ExerciseSetForm, fields=('exercise', 'reps_min', 'reps_max', 'amrap', 'rpe'),
+    extra=30, can_delete=False
 )
 
 PredictionFormSet = inlineformset_factory(
@@ -0,0 +1,89 @@
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import Set, Workout
+
+HISTORY_PAGE_SIZE = 25
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def make_cursor(date, workout_id):
+    """Opaque position after the given workout, for the next page."""
+    value = f'{date.isoformat() if date is not None else ""}|{workout_id}'
+    return urlsafe_base64_encode(value.encode())
+
+
+def parse_cursor(cursor):
+    """(date, workout_id) of a make_cursor() value, ValueError if it is not one."""
+    try:
+        date, workout_id = force_str(urlsafe_base64_decode(cursor)).split('|')
+    except (TypeError, UnicodeDecodeError, ValueError):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    parsed = parse_datetime(date) if date else None
+    if date and parsed is None:
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return parsed, int(workout_id)
+
+
+def set_totals(**aggregate):
+    """Correlated subquery of one aggregate over the sets of the outer workout."""
+    (name, expression), = aggregate.items()
+    return Subquery(Set.objects.filter(workout_id=OuterRef('workout_id'))
+                    .order_by()
+                    .values('workout_id')
+                    .annotate(**{name: expression})
+                    .values(name))
+
+
+def workout_history(user_id, after=None, day_id=None, exercise_id=None):
+    """A user's workouts newest first, from after the (date, workout_id) position on.
+
+    Keyset pagination: a page starts right after the previous page's last
+    workout instead of skipping OFFSET rows, so with the (user, date,
+    workout_id) index every page costs the same. Workouts without a date
+    come first, as PostgreSQL's descending order has them. Set counts and
+    volume are correlated subqueries, only evaluated for the returned rows.
+    """
+    workouts = Workout.objects.filter(user_id=user_id)
+    if day_id is not None:
+        workouts = workouts.filter(expected_id=day_id)
+    if exercise_id is not None:
+        workouts = workouts.filter(Exists(Set.objects.filter(workout_id=OuterRef('workout_id'),
+                                                             exercise_id=exercise_id)))
+    if after is not None:
+        date, workout_id = after
+        if date is None:
+            workouts = workouts.filter(Q(date__isnull=True, workout_id__lt=workout_id) | Q(date__isnull=False))
+        else:
+            # The redundant date__lte bounds the index range scan, the OR alone would not.
+            workouts = workouts.filter(Q(date__lte=date), Q(date__lt=date) | Q(workout_id__lt=workout_id))
+    volume = DecimalField(max_digits=20, decimal_places=2)
+    return workouts.order_by(F('date').desc(nulls_first=True), F('workout_id').desc()) \
+        .annotate(set_count=Coalesce(set_totals(set_count=Count('set_id')), 0),
+                  volume=Coalesce(set_totals(volume=Sum(F('reps') * F('weight'), output_field=volume)), 0,
+                                  output_field=volume)) \
+        .select_related('expected')
+
+
+def workout_page(user_id, after=None, day_id=None, exercise_id=None, size=HISTORY_PAGE_SIZE):
+    """One page of workout_history() and the cursor of the next page, None on the last one."""
+    page = list(workout_history(user_id, after, day_id, exercise_id)[:size + 1])
+    if len(page) > size:
+        page = page[:size]
+        return page, make_cursor(page[-1].date, page[-1].workout_id)
+    return page, None
+
+
+def serialise_workout(workout):
+    return {
+        'workout_id': workout.workout_id,
+        'date': workout.date.isoformat() if workout.date is not None else None,
+        'day_id': workout.expected_id,
+        'day': workout.expected.day_name if workout.expected_id is not None else None,
+        'complete': workout.complete,
+        'set_count': workout.set_count,
+        'volume': float(workout.volume),
+    }
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from .catalog import catalog
+from .charts import invalidate_series
+from .models import ProgramDay, Set, UnitType, UserWeight, Workout
+from .suggestions import invalidate_user
+from .summary import rebuild_workout_summaries
+
+IMPORT_CHUNK_SIZE = 5000
+
+SET_COPY_FIELDS = ['exercise_id', 'workout_id', 'reps', 'weight', 'rpe', 'set_number', 'unit_id']
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(lines):
+    """(line number, record) pairs of a CSV file with a header row, as written by export.py."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, {key.strip().lower(): value.strip() for key, value in record.items()
+                                if key is not None and value is not None}
+
+
+def read_ndjson(lines):
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, RowError(f'invalid JSON: {e}')
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def read_records(file, fmt):
+    """Records of an uploaded (binary) or opened text file."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    return READERS[fmt](file)
+
+
+def parse_timestamp(value):
+    if not value:
+        raise RowError('date is required')
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        day = parse_date(value)
+        if day is None:
+            raise RowError(f'invalid date {value!r}, expected YYYY-MM-DD or an ISO 8601 timestamp')
+        timestamp = datetime.combine(day, time.min)
+    return make_aware(timestamp) if is_naive(timestamp) else timestamp
+
+
+def parse_number(record, field, kind=Decimal, default=None):
+    value = record.get(field)
+    if value is None or value == '':
+        if default is None:
+            raise RowError(f'{field} is required')
+        return default
+    try:
+        # Through str so that JSON floats keep the digits they were written with.
+        number = kind(str(value))
+    except (InvalidOperation, ValueError):
+        raise RowError(f'{field} must be a number, got {value!r}')
+    if number < 0:
+        raise RowError(f'{field} must not be negative')
+    return number
+
+
+class HistoryImporter:
+    """Bulk import of a user's workouts, sets and body weights.
+
+    Takes the records of export.py: 'workout' records, 'set' records that
+    refer to them by workout_id (the id in the exported file, not in this
+    database) and 'bodyweight' records. A record without a type is a set,
+    and sets without a workout_id are grouped into one workout per date,
+    so a plain spreadsheet of date, exercise, reps, weight and rpe columns
+    imports as is. Exercises, units and program days are matched by name.
+
+    Records that do not validate are skipped and listed in errors with
+    their line number. Rows are written chunk_size records per transaction
+    with bulk inserts (COPY for the sets on PostgreSQL) and the exercise
+    summaries, chart series and suggestions are rebuilt once at the end.
+    Signals and prediction jobs are not run for imported workouts.
+    """
+
+    def __init__(self, user_id, chunk_size=IMPORT_CHUNK_SIZE):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.exercises = {entry.name.strip().lower(): entry.exercise_id for entry in catalog.entries().values()}
+        self.units = {label.strip().lower(): unit_id
+                      for unit_id, label in UnitType.objects.values_list('unit_id', 'label')}
+        self.days = {(program.strip().lower(), day.strip().lower()): day_id for day_id, program, day in
+                     ProgramDay.objects.values_list('program_day_id', 'program__program_name', 'day_name')}
+        self.default_unit = self.units.get('lbs')
+        self.seq_num = UserWeight.objects.filter(user_id=user_id).aggregate(seq_num=Max('seq_num'))['seq_num']
+        self.seq_num = -1 if self.seq_num is None else self.seq_num
+        # File workout key: Workout (pending), its id (written) or None (rejected)
+        self.workouts = {}
+        self.workout_lines = {}
+        self.set_numbers = {}
+        self.workout_ids = []
+        self.pending_workouts, self.pending_sets, self.pending_weights = [], [], []
+        self.counts = {'workout': 0, 'set': 0, 'bodyweight': 0}
+        self.errors = []
+
+    def run(self, records):
+        """Import (line number, record) pairs, returns self."""
+        pending = 0
+        for line_number, record in records:
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                if not isinstance(record, dict):
+                    raise RowError('not a JSON object')
+                self.add(record, line_number)
+            except RowError as e:
+                self.errors.append((line_number, str(e)))
+                continue
+            pending += 1
+            if pending >= self.chunk_size:
+                self.flush()
+                pending = 0
+        self.flush()
+        self.rebuild()
+        return self
+
+    def add(self, record, line_number):
+        kind = record.get('record') or 'set'
+        if kind == 'workout':
+            self.add_workout(record, line_number)
+        elif kind == 'set':
+            self.add_set(record)
+        elif kind == 'bodyweight':
+            self.add_weight(record)
+        else:
+            raise RowError(f'unknown record type {kind!r}')
+
+    def add_workout(self, record, line_number):
+        key = str(record.get('workout_id') or record.get('date') or '')
+        if key in self.workouts:
+            raise RowError(f'workout {key} is already defined on line {self.workout_lines[key]}')
+        self.workouts[key] = None
+        self.workout_lines[key] = line_number
+        date = parse_timestamp(record.get('date'))
+        expected = None
+        if record.get('program') or record.get('day'):
+            name = (str(record.get('program') or '').strip().lower(), str(record.get('day') or '').strip().lower())
+            if name not in self.days:
+                raise RowError(f'unknown program day {record.get("program")!r} / {record.get("day")!r}')
+            expected = self.days[name]
+        complete = parse_number(record, 'complete', int, default=1)
+        self.workouts[key] = Workout(user_id=self.user_id, date=date, complete=complete, expected_id=expected)
+        self.pending_workouts.append((key, self.workouts[key]))
+
+    def add_set(self, record):
+        key = str(record.get('workout_id') or record.get('date') or '')
+        if not key:
+            raise RowError('a set needs a workout_id or a date')
+        exercise = self.exercises.get(str(record.get('exercise') or '').strip().lower())
+        if exercise is None:
+            raise RowError(f'unknown exercise {record.get("exercise")!r}')
+        unit = self.default_unit
+        if record.get('unit'):
+            unit = self.units.get(str(record['unit']).strip().lower())
+            if unit is None:
+                raise RowError(f'unknown unit {record["unit"]!r}')
+        reps = parse_number(record, 'reps', int)
+        weight = parse_number(record, 'weight', default=Decimal(0))
+        rpe = parse_number(record, 'rpe')
+        if key in self.workouts and self.workouts[key] is None:
+            raise RowError(f'workout {key} on line {self.workout_lines[key]} was rejected')
+        # Numbered per exercise within the workout, as AddWorkoutView does.
+        number_key = (key, exercise)
+        set_number = parse_number(record, 'set_number', int, default=self.set_numbers.get(number_key, 0) + 1)
+        if key not in self.workouts:
+            # A spreadsheet row, the workout is implied by the date. Only created once the whole row is valid, a
+            # rejected row must not leave an empty workout behind.
+            self.workouts[key] = Workout(user_id=self.user_id, date=parse_timestamp(record.get('date')), complete=1)
+            self.pending_workouts.append((key, self.workouts[key]))
+        self.set_numbers[number_key] = set_number
+        # Plain tuples in SET_COPY_FIELDS order, COPY does not need model instances.
+        self.pending_sets.append((key, (exercise, reps, weight, rpe, set_number, unit)))
+
+    def add_weight(self, record):
+        unit = self.units.get(str(record.get('unit') or '').strip().lower())
+        if unit is None:
+            raise RowError(f'unknown unit {record.get("unit")!r}')
+        weight = parse_number(record, 'weight')
+        date = parse_timestamp(record['date']) if record.get('date') else None
+        seq_num = parse_number(record, 'seq_num', int, default=self.seq_num + 1)
+        self.seq_num = max(self.seq_num, seq_num)
+        self.pending_weights.append(UserWeight(user_id=self.user_id, weight=weight, seq_num=seq_num,
+                                               weight_unit_id=unit, date=date))
+
+    def flush(self):
+        with transaction.atomic():
+            workouts = [workout for _, workout in self.pending_workouts]
+            if connection.features.can_return_rows_from_bulk_insert:
+                Workout.objects.bulk_create(workouts)
+            else:
+                # Without RETURNING bulk_create leaves the ids unset and the sets need them.
+                for workout in workouts:
+                    workout.save()
+            for key, workout in self.pending_workouts:
+                self.workouts[key] = workout.pk
+                self.workout_ids.append(workout.pk)
+            sets = [(exercise, self.workouts[key], *values) for key, (exercise, *values) in self.pending_sets]
+            if connection.vendor == 'postgresql':
+                self.copy_sets(sets)
+            else:
+                Set.objects.bulk_create([Set(**dict(zip(SET_COPY_FIELDS, row))) for row in sets], batch_size=500)
+            UserWeight.objects.bulk_create(self.pending_weights, batch_size=500)
+        self.counts['workout'] += len(workouts)
+        self.counts['set'] += len(sets)
+        self.counts['bodyweight'] += len(self.pending_weights)
+        self.pending_workouts, self.pending_sets, self.pending_weights = [], [], []
+
+    @staticmethod
+    def copy_sets(sets):
+        if not sets:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in sets:
+            # An unquoted empty field is NULL in COPY's csv format.
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field) for field in SET_COPY_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {connection.ops.quote_name(Set._meta.db_table)} ({columns}) '
+                               f'FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def rebuild(self):
+        """Derived data of the imported workouts, in one pass rather than per workout."""
+        if not self.workout_ids:
+            return
+        rebuild_workout_summaries(self.workout_ids)
+        invalidate_series([self.user_id])
+        invalidate_user(self.user_id)
+
+
+def import_history(user_id, file, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import a CSV or NDJSON file into the user's history, returns the finished HistoryImporter."""
+    return HistoryImporter(user_id, chunk_size).run(read_records(file, fmt))
@@ -0,0 +1,182 @@
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the histogram buckets, the last bucket takes everything slower.
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# Every process publishes its histogram under its own key in the shared cache (see StageHistogram.publish), the
+# list of those processes is kept under PROCESSES_KEY. A process that stops publishing drops out after a day.
+PROCESSES_KEY = 'stage_histogram:processes'
+GENERATION_KEY = 'stage_histogram:generation'
+SHARED_TIMEOUT = 24 * 60 * 60
+
+
+def process_key(process):
+    return f'stage_histogram:{process}'
+
+
+class StageRecord:
+    """What one run of a stage did, the stage body sets rows."""
+
+    __slots__ = ['name', 'rows', 'ms', 'peak_kib']
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.ms = None
+        self.peak_kib = None
+
+
+class StageHistogram:
+    """In process latency histogram and totals per stage, published to the shared cache for shared_snapshot()."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._generation = None
+
+    def add(self, record):
+        bucket = bisect.bisect_left(BUCKETS_MS, record.ms)
+        with self._lock:
+            self._dirty = True
+            stats = self._stages.get(record.name)
+            if stats is None:
+                stats = self._stages[record.name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                                     'max_peak_kib': None, 'buckets': [0] * (len(BUCKETS_MS) + 1)}
+            stats['count'] += 1
+            stats['total_ms'] += record.ms
+            stats['max_ms'] = max(stats['max_ms'], record.ms)
+            stats['rows'] += record.rows or 0
+            if record.peak_kib is not None:
+                stats['max_peak_kib'] = max(stats['max_peak_kib'] or 0, record.peak_kib)
+            stats['buckets'][bucket] += 1
+
+    def stages(self):
+        with self._lock:
+            return {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self._stages.items()}
+
+    def snapshot(self):
+        """JSON friendly statistics of this process, see summarise()."""
+        return {'pid': os.getpid(), 'stages': self.summarise(self.stages())}
+
+    @classmethod
+    def summarise(cls, stages):
+        """Add bucket bound estimates of the median and 95th percentile to the stages' statistics."""
+        labels = [f'<={bound}' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}']
+        for stats in stages.values():
+            stats['mean_ms'] = stats['total_ms'] / stats['count']
+            stats['p50_ms'] = cls.quantile(stats['buckets'], .5)
+            stats['p95_ms'] = cls.quantile(stats['buckets'], .95)
+            stats['buckets'] = dict(zip(labels, stats['buckets']))
+        return stages
+
+    @staticmethod
+    def quantile(buckets, q):
+        """Upper bound of the bucket holding the q quantile, None for the open ended last bucket."""
+        target = q * sum(buckets)
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._dirty = False
+
+    def publish(self, force=False):
+        """Write this process's statistics to the shared cache, if stages ran since the last time.
+
+        The statistics are cleared first when another process reset the
+        shared histogram (reset_shared) since this one last published.
+        """
+        if not (self._dirty or force):
+            return
+        process = f'{socket.gethostname()}:{os.getpid()}'
+        found = cache.get_many([GENERATION_KEY, PROCESSES_KEY])
+        generation = found.get(GENERATION_KEY)
+        if self._generation is not None and generation != self._generation:
+            self.reset()
+        self._generation = generation
+        with self._lock:
+            self._dirty = False
+        cache.set(process_key(process), self.stages(), SHARED_TIMEOUT)
+        processes = found.get(PROCESSES_KEY) or []
+        if process not in processes:
+            # Not atomic, a registration lost to a concurrent one is repeated on the next publish.
+            cache.set(PROCESSES_KEY, processes + [process], None)
+
+    def shared_snapshot(self):
+        """Statistics of every process that published its histogram, merged, in the format of snapshot()."""
+        self.publish()
+        processes = cache.get(PROCESSES_KEY) or []
+        published = cache.get_many([process_key(process) for process in processes])
+        merged = {}
+        for stages in published.values():
+            for name, stats in stages.items():
+                total = merged.get(name)
+                if total is None:
+                    merged[name] = dict(stats, buckets=list(stats['buckets']))
+                    continue
+                for field in ('count', 'total_ms', 'rows'):
+                    total[field] += stats[field]
+                total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+                if stats['max_peak_kib'] is not None:
+                    total['max_peak_kib'] = max(total['max_peak_kib'] or 0, stats['max_peak_kib'])
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        live = sorted(process for process in processes if process_key(process) in published)
+        if len(live) < len(processes):
+            # Processes that stopped publishing, their statistics expired.
+            cache.set(PROCESSES_KEY, live, None)
+        return {'processes': live, 'stages': self.summarise(merged)}
+
+    def reset_shared(self):
+        """Reset the histograms of every process, the others clear theirs on their next publish."""
+        processes = cache.get(PROCESSES_KEY) or []
+        cache.delete_many([process_key(process) for process in processes] + [PROCESSES_KEY])
+        self._generation = uuid.uuid4().hex
+        cache.set(GENERATION_KEY, self._generation, None)
+        self.reset()
+
+
+histogram = StageHistogram()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage, log it and add it to the histogram.
+
+    Peak allocations are only measured while tracemalloc is tracing (start
+    the process with PYTHONTRACEMALLOC=1), otherwise the overhead is two
+    clock reads and a dictionary update.
+    """
+    record = StageRecord(name)
+    tracing = tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+    if tracing:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.ms = (time.perf_counter() - start) * 1000
+        if tracing:
+            record.peak_kib = (tracemalloc.get_traced_memory()[1] - start_memory) / 1024
+        histogram.add(record)
+        logger.info('stage=%s ms=%.2f rows=%s peak_kib=%s', record.name, record.ms, record.rows,
+                    None if record.peak_kib is None else round(record.peak_kib),
+                    extra={'stage': record.name, 'ms': record.ms, 'rows': record.rows, 'peak_kib': record.peak_kib})
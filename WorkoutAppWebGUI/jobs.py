@@ -0,0 +1,79 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry of a failed job, doubled on every further attempt.
+RETRY_DELAY = 30
+# A job left running this long belonged to a worker that died, hand it out again.
+STALE_AFTER = timedelta(minutes=10)
+# Finished jobs are deleted this long after they ran, failed ones are kept for inspection.
+KEEP_DONE = timedelta(days=1)
+
+TASKS = {
+    'populate_predictions': 'WorkoutAppWebGUI.ml.populate_predictions',
+    'refresh_suggestions': 'WorkoutAppWebGUI.suggestions.predict_users',
+}
+
+
+def enqueue(task, workout=None, **payload):
+    if task not in TASKS:
+        raise ValueError(f'Unknown task {task}')
+    return Job.objects.create(task=task, workout=workout, payload=payload)
+
+
+def claim(limit):
+    """Mark up to limit runnable jobs as running and return them.
+
+    Rows are locked with SKIP LOCKED where the database supports it so that
+    several workers can share the queue.
+    """
+    now = timezone.now()
+    runnable = Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, updated__lt=now - STALE_AFTER)
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(runnable).order_by('job_id')[:limit])
+        Job.objects.filter(job_id__in=[job.job_id for job in jobs]) \
+            .update(status=Job.RUNNING, attempts=F('attempts') + 1, updated=now)
+    for job in jobs:
+        job.status = Job.RUNNING
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job):
+    try:
+        import_string(TASKS[job.task])(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            logger.exception('Job %s failed for good after %s attempts', job, job.attempts)
+        else:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+            logger.warning('Job %s failed, retrying at %s', job, job.run_after)
+    else:
+        job.status = Job.DONE
+    job.save(update_fields=['status', 'run_after', 'last_error', 'updated'])
+
+
+def run_pending(limit=10):
+    """Run one batch of runnable jobs, returns how many were run."""
+    jobs = claim(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def prune(keep=KEEP_DONE):
+    """Delete the jobs that finished more than keep ago, returns how many."""
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated__lt=timezone.now() - keep).delete()
+    return deleted
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from WorkoutAppWebGUI.suggestions import run_batch
+
+
+class Command(BaseCommand):
+    help = 'Precompute suggested sets for every day of every current user program'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Number of users whose features are held in memory at once')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of feature rows passed to the model per call')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Process chunks in a pool of this many processes')
+
+    def handle(self, *args, **options):
+        written = run_batch(options['chunk_size'], options['batch_size'], options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} workout suggestions'))
@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from WorkoutAppWebGUI.benchmarks import run_benchmarks, compare
+from WorkoutAppWebGUI.synthetic import generate_history
+
+
+class Command(BaseCommand):
+    help = ('Time the prediction and chart code paths on a synthetic history and compare against a baseline. '
+            'Runs in a throwaway test database, the configured cache is cleared.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--programs', type=int, default=2, help='Programs each user runs through')
+        parser.add_argument('--years', type=float, default=2, help='Years of history per user')
+        parser.add_argument('--workouts-per-week', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+        parser.add_argument('--only', action='append', dest='names', help='Only run this benchmark (can be repeated)')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'),
+                            help='Baseline results file')
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown or memory growth before a result counts as a regression')
+        parser.add_argument('--check', action='store_true', help='Exit with an error on any regression')
+
+    def handle(self, *args, **options):
+        sizes = {key: options[key] for key in ['users', 'programs', 'years', 'workouts_per_week', 'seed']}
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cache.clear()
+        try:
+            start = time.perf_counter()
+            generate_history(**sizes)
+            self.stdout.write(f'Generated history in {time.perf_counter() - start:.1f}s')
+            results = run_benchmarks(options['repeat'], options['names'])
+        finally:
+            cache.clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f'{"benchmark":<24}{"median ms":>12}{"min ms":>12}{"peak KiB":>12}')
+        for name, result in results.items():
+            self.stdout.write(f'{name:<24}{result["median_ms"]:>12.1f}{result["min_ms"]:>12.1f}'
+                              f'{result["peak_kib"]:>12.0f}')
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({'sizes': sizes, 'results': results}, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline to {options["baseline"]}'))
+            return
+
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write(f'No baseline at {options["baseline"]}, store one with --save-baseline')
+            return
+        if baseline['sizes'] != sizes:
+            self.stdout.write(self.style.WARNING(f'Baseline was taken with {baseline["sizes"]}, not comparable'))
+            return
+
+        regressions = 0
+        for name, metric, before, current, ratio, regressed in compare(results, baseline['results'],
+                                                                       options['tolerance']):
+            line = f'{name:<24}{metric:<12}{before:>12.1f} -> {current:>10.1f} ({ratio - 1:+.0%})'
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+            regressions += regressed
+        if regressions and options['check']:
+            raise CommandError(f'{regressions} benchmark results regressed by more than {options["tolerance"]:.0%}')
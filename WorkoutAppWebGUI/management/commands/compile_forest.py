@@ -0,0 +1,30 @@
+import pickle
+
+import numpy
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutAppWebGUI.forest import CompiledForest, sample_inputs
+
+
+class Command(BaseCommand):
+    help = 'Compile a pickled RandomForestClassifier into the flat array format served by the model registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', default=str(settings.BASE_DIR / 'RFCModel.pkl'))
+        parser.add_argument('output', nargs='?', default=str(settings.BASE_DIR / 'RFCModel.npz'))
+        parser.add_argument('--check-rows', type=int, default=100000,
+                            help='Number of sampled rows the compiled forest must predict exactly like sklearn')
+
+    def handle(self, *args, **options):
+        with open(options['source'], 'rb') as infile:
+            model = pickle.load(infile)
+        forest = CompiledForest.compile(model)
+        X = sample_inputs(forest, options['check_rows'])
+        if not numpy.array_equal(forest.predict_proba(X), model.predict_proba(X)):
+            raise CommandError('Compiled forest does not reproduce the sklearn probabilities')
+        with open(options['output'], 'wb') as outfile:
+            forest.save(outfile)
+        self.stdout.write(self.style.SUCCESS(
+            f'Compiled {len(forest.roots)} trees ({len(forest.feature)} nodes) to {options["output"]}, '
+            f'verified on {len(X)} rows'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutAppWebGUI.export import EXPORT_CHUNK_SIZE, FORMATS, stream_history
+from WorkoutAppWebGUI.models import WAUser
+
+
+class Command(BaseCommand):
+    help = "Stream a user's workouts, sets and body weights as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', type=int)
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to, standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Number of rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if not WAUser.objects.filter(pk=options['user']).exists():
+            raise CommandError(f'No user {options["user"]}')
+        blocks = stream_history(options['user'], options['format'], options['chunk_size'])
+        if options['output'] is None:
+            for block in blocks:
+                self.stdout.write(block, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as outfile:
+            outfile.writelines(blocks)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
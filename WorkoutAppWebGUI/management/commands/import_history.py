@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutAppWebGUI.importer import IMPORT_CHUNK_SIZE, READERS, import_history
+from WorkoutAppWebGUI.models import WAUser
+
+
+class Command(BaseCommand):
+    help = "Bulk import workouts, sets and body weights from a CSV or NDJSON file into a user's history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', type=int)
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='File format, by default the file extension')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help='Number of records written per transaction')
+
+    def handle(self, *args, **options):
+        if not WAUser.objects.filter(pk=options['user']).exists():
+            raise CommandError(f'No user {options["user"]}')
+        fmt = options['format'] or options['file'].rsplit('.', 1)[-1].lower()
+        if fmt not in READERS:
+            raise CommandError(f'Cannot tell the format of {options["file"]}, use --format')
+        with open(options['file'], newline='', encoding='utf-8-sig') as infile:
+            result = import_history(options['user'], infile, fmt, options['chunk_size'])
+        for line_number, error in result.errors:
+            self.stderr.write(f'line {line_number}: {error}')
+        counts = result.counts
+        message = (f'Imported {counts["workout"]} workouts, {counts["set"]} sets and {counts["bodyweight"]} body '
+                   f'weights, skipped {len(result.errors)} rows')
+        self.stdout.write(self.style.WARNING(message) if result.errors else self.style.SUCCESS(message))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from WorkoutAppWebGUI.charts import invalidate_series
+from WorkoutAppWebGUI.models import WAUser
+from WorkoutAppWebGUI.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per workout exercise summary table from the logged sets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user (can be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of workouts rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        written = rebuild_summaries(options['users'], options['chunk_size'])
+        invalidate_series(options['users'] or WAUser.objects.values_list('user_id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} exercise summary rows'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from WorkoutAppWebGUI.instrumentation import histogram
+from WorkoutAppWebGUI.jobs import prune, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (prediction scoring, suggestion refreshes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due now and exit')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Number of jobs claimed at a time')
+        parser.add_argument('--sleep', type=float, default=2,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--prune-every', type=float, default=3600,
+                            help='Seconds between deletions of finished jobs')
+
+    def handle(self, *args, **options):
+        pruned_at = None
+        while True:
+            if pruned_at is None or time.monotonic() - pruned_at >= options['prune_every']:
+                pruned = prune()
+                pruned_at = time.monotonic()
+                if pruned:
+                    self.stdout.write(f'Deleted {pruned} finished jobs')
+            ran = run_pending(options['batch_size'])
+            histogram.publish()
+            if ran:
+                self.stdout.write(f'Ran {ran} jobs')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,59 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_query_budget(url_name, method='GET'):
+    """Budget of '<METHOD> <url name>', else of the URL name, else QUERY_BUDGET_DEFAULT."""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    default = budgets.get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+    return budgets.get(f'{method} {url_name}', default)
+
+
+class QueryBudgetMiddleware:
+    """Record the number of queries and the database time of every request.
+
+    The totals are left on the request as query_count and query_time (in
+    seconds). Requests whose view ran more queries than its budget in
+    settings.QUERY_BUDGETS (see get_query_budget) are logged as warnings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        request.query_count = counter.count
+        request.query_time = counter.duration
+
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = get_query_budget(url_name, request.method)
+        if budget is not None and counter.count > budget:
+            logger.warning('%s %s (%s) ran %d queries in %.1f ms, over its budget of %d',
+                           request.method, request.path, url_name, counter.count, counter.duration * 1000, budget)
+        else:
+            logger.debug('%s %s (%s) ran %d queries in %.1f ms',
+                         request.method, request.path, url_name, counter.count, counter.duration * 1000)
+        return response
@@ -0,0 +1,66 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:19
+
+import math
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    # Summaries of the logged history, with the aggregates and the one rep max formula (Predictor) of this
+    # migration's time rather than the app code's, which may change.
+    Set = apps.get_model('WorkoutAppWebGUI', 'Set')
+    ExerciseSummary = apps.get_model('WorkoutAppWebGUI', 'ExerciseSummary')
+    rows = Set.objects.values('workout_id', 'workout__user_id', 'workout__date', 'exercise_id') \
+        .order_by('workout_id') \
+        .annotate(avg_reps=Avg('reps'), avg_weight=Avg('weight'), avg_rpe=Avg('rpe'),
+                  set_count=Count('set_id'), max_set_num=Max('set_number'))
+    summaries = []
+    for row in rows.iterator():
+        avg_reps, avg_weight = float(row['avg_reps']), float(row['avg_weight'])
+        summaries.append(ExerciseSummary(user_id=row['workout__user_id'],
+                                         workout_id=row['workout_id'],
+                                         exercise_id=row['exercise_id'],
+                                         date=row['workout__date'],
+                                         avg_reps=avg_reps,
+                                         avg_weight=avg_weight,
+                                         avg_rpe=float(row['avg_rpe']),
+                                         set_count=row['set_count'],
+                                         max_set_num=row['max_set_num'],
+                                         one_rep_max=100 * avg_weight / (48.8 + 53.8 * math.exp(-0.075 * avg_reps))))
+        if len(summaries) >= 500:
+            ExerciseSummary.objects.bulk_create(summaries)
+            summaries = []
+    ExerciseSummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutAppWebGUI', '0010_auto_20210814_0137'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseSummary',
+            fields=[
+                ('summary_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateTimeField(blank=True, null=True)),
+                ('avg_reps', models.FloatField()),
+                ('avg_weight', models.FloatField()),
+                ('avg_rpe', models.FloatField()),
+                ('set_count', models.IntegerField()),
+                ('max_set_num', models.IntegerField()),
+                ('one_rep_max', models.FloatField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='WorkoutAppWebGUI.exercisetype')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='WorkoutAppWebGUI.wauser')),
+                ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutAppWebGUI.workout')),
+            ],
+            options={
+                'db_table': 'exercise_summary',
+                'unique_together': {('user', 'workout', 'exercise')},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutAppWebGUI', '0011_exercisesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutSuggestion',
+            fields=[
+                ('suggestion_id', models.AutoField(primary_key=True, serialize=False)),
+                ('sets', models.JSONField()),
+                ('model_version', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(auto_now=True)),
+                ('day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutAppWebGUI.programday')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='WorkoutAppWebGUI.wauser')),
+            ],
+            options={
+                'db_table': 'workout_suggestion',
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
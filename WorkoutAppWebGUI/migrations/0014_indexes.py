@@ -0,0 +1,37 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutAppWebGUI', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercisesummary',
+            index=models.Index(fields=['user', 'exercise', 'workout'], name='summary_user_exercise_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercisesummary',
+            index=models.Index(fields=['user', 'date'], name='summary_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expectedset',
+            index=models.Index(fields=['day', 'set_num'], name='expected_set_day_set_num_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogram',
+            index=models.Index(fields=['user', 'current'], name='user_program_user_current_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'expected'], name='workout_user_expected_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'date', 'workout_id'], name='workout_user_date_idx'),
+        ),
+    ]
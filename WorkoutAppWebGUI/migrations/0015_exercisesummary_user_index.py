@@ -0,0 +1,19 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutAppWebGUI', '0014_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exercisesummary',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='WorkoutAppWebGUI.wauser'),
+        ),
+    ]
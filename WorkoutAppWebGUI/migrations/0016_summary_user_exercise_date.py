@@ -0,0 +1,21 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutAppWebGUI', '0015_exercisesummary_user_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='exercisesummary',
+            name='summary_user_exercise_idx',
+        ),
+        migrations.AddIndex(
+            model_name='exercisesummary',
+            index=models.Index(fields=['user', 'exercise', 'date'], name='summary_user_exercise_idx'),
+        ),
+    ]
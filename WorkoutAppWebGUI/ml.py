@@ -1,115 +1,96 @@
 import csv
 import pandas
-import pickle
 import numpy
 import pandas as pd
 
-from .models import Set, ExpectedSet, ExerciseType, Workout
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, F, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .catalog import catalog
+from .instrumentation import stage
+from .models import Workout, ExerciseSummary, Prediction
+from .programs import ExpectedSetNode, get_program_day
+from .registry import get_model
+
+FEATURE_COLUMNS = ['min_reps', 'max_reps', 'reps', 'rpe', 'set_num', 'user_id']
+# Summary rows kept per exercise and kind of workout (see Predictor.get_previous_data).
+HISTORY_DEPTH = 1
+HISTORY_CHUNK_SIZE = 2000
+# weight stays float64, it is carried into the recommended weight.
+HISTORY_DTYPES = {'workout_id': 'int32', 'exercise_id': 'int32', 'reps': 'float32', 'weight': 'float64',
+                  'rpe': 'float32', 'in_day': 'bool', 'eligible': 'bool'}
 
 
 class Predictor:
 
     def __init__(self, day, user):
-        self.previous_data = self.get_previous_data(day, user)
-        self.day = self.get_program_day(day)
+        self.day_id = day.program_day_id
         self.user = user
-        self.model = pickle.load(open("RFCModel.pkl", 'rb'))
+        with stage('predictor.get_previous_data') as record:
+            self.previous_data = self.get_previous_data(day, user)
+            record.rows = len(self.previous_data)
+        with stage('predictor.get_program_day') as record:
+            self.day = self.get_program_day(day)
+            record.rows = len(self.day)
+        with stage('predictor.load_model'):
+            self.model = get_model()
 
     def fit_svc(self):
+        ex_data = self.get_features()
+        if ex_data is None:
+            return None
+        with stage('predictor.model_predict') as record:
+            ex_data['suggestion'] = self.model.predict(ex_data[FEATURE_COLUMNS])
+            record.rows = len(ex_data)
+        return ex_data
+
+    def get_features(self):
+        """Model input rows, one per exercise, or None when the user has no history for the day."""
         if self.previous_data.empty:
             return None
-        ex_data = self.create_exercise_dataset()
-        ex_data['user_id'] = self.user
-        ex_data['suggestion'] = self.model.predict(ex_data[['min_reps', 'max_reps', 'reps', 'rpe', 'set_num', 'user_id']])
+        with stage('predictor.create_exercise_dataset') as record:
+            ex_data = self.create_exercise_dataset()
+            ex_data['user_id'] = self.user
+            record.rows = len(ex_data)
         return ex_data
 
     def create_exercise_dataset(self):
-        prev_data = self.previous_data.copy()
-        prev_data["weight"] = pandas.to_numeric(prev_data["weight"])
-        data = pandas.DataFrame()
-        exercise_list = self.previous_data.exercise_id.unique()
-        rep_ranges = self.get_rep_ranges()
-        for exercise in exercise_list:
-            exercise_data = self.get_exercise_data(exercise)
-            most_recent = max(exercise_data['workout_id'])
-            ex_data = prev_data[(prev_data["workout_id"] == most_recent) & (prev_data["exercise_id"] == exercise)].copy()
-            ex_data['rpe'] = ex_data['rpe'].astype('int64')
-            ex_data = ex_data.groupby('exercise_id').agg({
-                "reps": "mean",
-                "weight": "mean",
-                'rpe': 'mean'})
-            ex_data = ex_data.reset_index()
-            rep_data = self.day.loc[self.day['exercise_id'] == exercise].copy()
-            rep_data = rep_data.groupby('exercise_id').agg({'reps_min': 'mean',
-                                                            'reps_max': 'mean',
-                                                            'set_num': 'max'})
-            rep_data = rep_data.reset_index()
-            ex_data['min_reps'] = rep_data['reps_min']
-            ex_data['max_reps'] = rep_data['reps_max']
-            ex_data['set_num'] = rep_data['set_num']
-            data = data.append(ex_data)
-
+        most_recent = self.get_most_recent_workouts(self.previous_data)
+        ex_data = self.previous_data.merge(most_recent, on=['exercise_id', 'workout_id'])
+        ex_data = ex_data[['exercise_id', 'reps', 'weight', 'rpe']].set_index('exercise_id')
+        rep_data = self.day.groupby('exercise_id').agg({'reps_min': 'mean',
+                                                        'reps_max': 'mean',
+                                                        'set_num': 'max'})
+        rep_data.columns = ['min_reps', 'max_reps', 'set_num']
+        data = ex_data.join(rep_data, how='left').reset_index()
         return data
 
-    def get_rep_ranges(self):
-        rep_ranges = {}
-        exercise_list = self.day.exercise_id.unique()
-        for exercise in exercise_list:
-            ex_data = self.day[self.day['exercise_id'] == exercise]
-            ex_reps = [(mn, mx, amrap) for mn, mx, amrap in zip(ex_data['reps_min'], ex_data['reps_max'], ex_data['amrap'])]
-            rep_ranges[exercise] = list(set(ex_reps))
-            if len(rep_ranges[exercise]) == 2:
-                rng1 = rep_ranges[exercise][0]
-                rng2 = rep_ranges[exercise][1]
-                rep_ranges[exercise] = [(int((rng1[0] + rng2[0])/2), int((rng1[1] + rng2[1])/2))]
-        return rep_ranges
-
-    def get_exercise_data(self, exercise):
-        temp = self.previous_data.copy()
-        workout_ids = self.get_workouts()
-        valid_workouts = temp[temp.workout_id.isin(workout_ids)]
-        if not workout_ids or exercise not in valid_workouts.exercise_id.tolist():
-            original_data = temp[temp['exercise_id'] == exercise]
-        else:
-            original_data = valid_workouts[valid_workouts['exercise_id'] == exercise]
-        exercise_data = original_data.groupby('workout_id').agg(
-            {
-                'exercise_id': 'max',
-                'reps': 'mean'
-            }
-        ).copy()
-        exercise_data = exercise_data.reset_index()
-        exercise_data['rounded'] = round(exercise_data['reps'])
-        max_reps = max(exercise_data['rounded'])
-        data = []
-        for rep in range(1, int(max_reps)+1):
-            if rep in exercise_data['rounded'].values:
-                rep_data = exercise_data.copy()
-                rep_data = rep_data[rep_data['rounded'] == rep]
-                recent_workout = max(rep_data['workout_id'])
-                data.append({'reps': rep, 'workout_id': recent_workout})
-            elif rep in original_data['reps'].values:
-                rep_data = original_data.copy()
-                rep_data = rep_data[rep_data['reps'] == rep]
-                recent_workout = max(rep_data['workout_id'])
-                data.append({'reps': rep, 'workout_id': recent_workout})
-
-        data = pandas.DataFrame(data)
-        return data
+    def get_most_recent_workouts(self, prev_data):
+        """Pick, for every exercise at once, the workout whose averages feed the features.
+
+        Exercises that were already performed on this program day only look at those
+        workouts. Within that history the latest workout whose average reps round to
+        at least one wins.
+        """
+        in_day = prev_data['in_day']
+        day_exercises = prev_data.loc[in_day, 'exercise_id'].unique()
+        history = prev_data[in_day | ~prev_data['exercise_id'].isin(day_exercises)]
+        eligible = history[history['eligible']]
+        return eligible.groupby('exercise_id', as_index=False)['workout_id'].max()
 
     def parse_data(self, recommended=None):
         data = []
         i = 1
-        exercise_names = {ex.exercise_id: ex for ex in ExerciseType.objects.all()}
+        exercises = catalog.entries()
         for exercise in self.day.exercise_id.unique():
             ex_data = self.day[self.day['exercise_id'] == exercise].copy()
             sets = ex_data.set_num.unique()
-            exercise_obj = exercise_names[exercise]
-            exercise_name = exercise_names[exercise].name
+            exercise_name = exercises[exercise].name
             for set_num in sets:
                 ex_set = ex_data[ex_data['set_num'] == set_num].copy()
                 j = ex_set.index[ex_set['set_num'] == set_num].tolist()[0]
-                set_data = {'exercise': exercise_obj}
+                set_data = {'exercise': int(exercise)}
                 if not recommended or exercise_name not in recommended.keys():
                     set_data['weight'] = 0
                 else:
@@ -133,27 +114,32 @@ class Predictor:
         return data
 
     def predict(self):
+        return self.recommend(self.fit_svc())
+
+    def recommend(self, fitted):
+        """Turn model output (see fit_svc) into the initial data of the set formset."""
+        with stage('predictor.parse_data') as record:
+            sets = self.parse_data(self.recommended_weights(fitted) if fitted is not None else None)
+            record.rows = len(sets)
+        return sets
+
+    def recommended_weights(self, fitted):
         data = {}
-        fitted = self.fit_svc()
-        if fitted is None:
-            return self.parse_data()
-        exercise_names = {ex.exercise_id: ex.name for ex in ExerciseType.objects.all()}
-        exercise_modifiers = {ex.name: ex.weight_step for ex in ExerciseType.objects.all()}
-        exercise_types = {ex.name: ex.weighted for ex in ExerciseType.objects.all()}
+        exercises = catalog.entries()
         for exercise in fitted.exercise_id.unique():
             exercise_data = fitted[fitted["exercise_id"] == exercise]
-            exercise_name = exercise_names[exercise]
+            exercise_name = exercises[exercise].name
             data[exercise_name] = {}
-            if exercise_types[exercise_name]:
+            if exercises[exercise].weighted:
 
-                degree = numpy.floor((exercise_data['reps']-exercise_data['max_reps'])+1) * exercise_data["suggestion"][0]
-                value = (degree * float(exercise_modifiers[exercise_name]))
-                base = float(exercise_modifiers[exercise_name])
+                degree = numpy.floor((exercise_data['reps']-exercise_data['max_reps'])+1) \
+                    * exercise_data["suggestion"].iat[0]
+                value = (degree * float(exercises[exercise].weight_step))
+                base = float(exercises[exercise].weight_step)
                 data[exercise_name] = exercise_data['weight'].iat[0] + self.rounding_for_weights(value.iat[0], base)
             else:
                 data[exercise_name] = 0
-
-        return self.parse_data(data)
+        return data
 
     def interpolate_missing_vals(self, data, rnge):
         min_val = min(data['min_reps'])
@@ -165,15 +151,6 @@ class Predictor:
         value = numpy.floor((one_rm * percent)*0.95)
         return value
 
-    def get_workouts(self):
-        day_id = self.day.day_id.max()
-        workouts = Workout.objects.filter(expected=day_id).filter(user_id=self.user).all().values('workout_id')
-        if workouts:
-            workouts = [workout['workout_id'] for workout in workouts]
-        else:
-            workouts = []
-        return workouts
-
     @staticmethod
     def get_exercise_modifiers():
         data = {}
@@ -184,15 +161,43 @@ class Predictor:
 
     @staticmethod
     def get_previous_data(day, user):
-        exercise_list = list(set([ex.exercise.pk for ex in day]))
-        previous_data = pandas.DataFrame.from_records(
-            Set.objects.filter(workout__user_id=user).filter(exercise__in=exercise_list).all().values())
-        return previous_data
+        """The user's most recent exercise summaries for the day's exercises.
+
+        Only the last HISTORY_DEPTH workouts of every (exercise, logged for this
+        day, eligible) partition are read, which is all get_most_recent_workouts
+        needs, so the cost does not grow with the length of the history.
+        Eligible rows have average reps that round (half to even, like pandas)
+        to at least one.
+        """
+        exercise_list = list(set([ex.exercise_id for ex in day.sets]))
+        in_day = Case(When(workout__expected_id=day.program_day_id, then=Value(True)), default=Value(False),
+                      output_field=BooleanField())
+        eligible = Case(When(avg_reps__gt=.5, then=Value(True)), default=Value(False), output_field=BooleanField())
+        ranked = ExerciseSummary.objects.filter(user_id=user).filter(exercise__in=exercise_list) \
+            .values('workout_id', 'exercise_id', reps=F('avg_reps'), weight=F('avg_weight'), rpe=F('avg_rpe'),
+                    in_day=in_day, eligible=eligible,
+                    recency=Window(RowNumber(), partition_by=[F('exercise_id'), in_day, eligible],
+                                   order_by=F('workout_id').desc()))
+        sql, params = ranked.query.sql_with_params()
+        columns = list(HISTORY_DTYPES)
+        frames = []
+        with connection.cursor() as cursor:
+            # Window functions can not be filtered on in the same query.
+            cursor.execute(f'SELECT {", ".join(columns)} FROM ({sql}) history WHERE recency <= %s',
+                           params + (HISTORY_DEPTH,))
+            while True:
+                rows = cursor.fetchmany(HISTORY_CHUNK_SIZE)
+                if not rows:
+                    break
+                frames.append(pandas.DataFrame.from_records(rows, columns=columns).astype(HISTORY_DTYPES))
+        if not frames:
+            return pandas.DataFrame(columns=columns).astype(HISTORY_DTYPES)
+        return pandas.concat(frames, ignore_index=True)
 
     @staticmethod
     def get_program_day(day):
-        day_data = list(day.all().values())
-        data = pandas.DataFrame.from_records(day_data)
+        day_data = [ex_set._asdict() for ex_set in day.sets]
+        data = pandas.DataFrame.from_records(day_data, columns=ExpectedSetNode._fields)
         return data
 
     @staticmethod
@@ -212,25 +217,48 @@ class Predictor:
 
 
 def quick_predict(pk):
-    model = pickle.load(open("RFCModel.pkl", 'rb'))
-    data = pd.DataFrame.from_records(
-        Set.objects.filter(workout_id=pk).all().values()
-    )
-    data['rpe'] = data['rpe'].astype('int64')
-    day = Workout.objects.filter(workout_id=pk).values('expected_id').first()['expected_id']
-    user = Workout.objects.filter(workout_id=pk).values('user_id').first()['user_id']
-    expected = pd.DataFrame.from_records(
-        ExpectedSet.objects.filter(day_id=day).all().values()
-    )
-
-    expected = expected.groupby('exercise_id').agg({'reps_min': 'mean',
-                                                    'reps_max': 'mean',
-                                                    'set_num': 'max'})
-    data = data.groupby('exercise_id').agg({'reps': 'mean',
-                                            'rpe': 'mean'})
-
-    data = data.merge(expected, left_index=True, right_index=True, how='left')
-    data['user_id'] = user
-    data['suggestion'] = model.predict(data[['reps_min', 'reps_max', 'reps', 'rpe', 'set_num', 'user_id']])
+    with stage('quick_predict.load_model'):
+        model = get_model()
+    with stage('quick_predict.load_summary') as record:
+        data = pd.DataFrame.from_records(
+            ExerciseSummary.objects.filter(workout_id=pk).values('exercise_id', reps=F('avg_reps'), rpe=F('avg_rpe'))
+        )
+        record.rows = len(data)
+    if data.empty:
+        return pd.DataFrame(columns=['exercise_id', 'reps', 'rpe', 'suggestion'])
+    with stage('quick_predict.get_program_day') as record:
+        workout = Workout.objects.filter(workout_id=pk).values('expected_id', 'user_id').first()
+        day = workout['expected_id']
+        user = workout['user_id']
+        day = get_program_day(day) if day is not None else None
+        expected = pd.DataFrame.from_records(
+            [ex_set._asdict() for ex_set in day.sets] if day is not None else [], columns=ExpectedSetNode._fields
+        )
+        record.rows = len(expected)
+
+    with stage('quick_predict.create_dataset') as record:
+        expected = expected.groupby('exercise_id').agg({'reps_min': 'mean',
+                                                        'reps_max': 'mean',
+                                                        'set_num': 'max'})
+        data = data.set_index('exercise_id')
+        data = data.merge(expected, left_index=True, right_index=True, how='left')
+        data['user_id'] = user
+        record.rows = len(data)
+    with stage('quick_predict.model_predict') as record:
+        data['suggestion'] = model.predict(data[['reps_min', 'reps_max', 'reps', 'rpe', 'set_num', 'user_id']])
+        record.rows = len(data)
     data.reset_index(inplace=True)
-    return data[['exercise_id', 'suggestion']]
+    return data[['exercise_id', 'reps', 'rpe', 'suggestion']]
+
+
+def populate_predictions(pk):
+    data = quick_predict(pk)
+    predictions = [Prediction(workout_id_id=pk,
+                              exercise_id=int(row.exercise_id),
+                              avg_reps=float(row.reps),
+                              avg_rpe=float(row.rpe),
+                              recommendation=int(row.suggestion)) for row in data.itertuples(index=False)]
+    with transaction.atomic():
+        # Safe to run again when a retried job already got this far.
+        Prediction.objects.filter(workout_id=pk).delete()
+        Prediction.objects.bulk_create(predictions)
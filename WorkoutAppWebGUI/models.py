@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class ExerciseType(models.Model):
@@ -50,6 +51,7 @@ class ExpectedSet(models.Model):
 
     class Meta:
         db_table = 'expected_set'
+        indexes = [models.Index(fields=['day', 'set_num'], name='expected_set_day_set_num_idx')]
 
 
 class Set(models.Model):
@@ -98,6 +100,7 @@ class UserProgram(models.Model):
 
     class Meta:
         db_table = 'user_program'
+        indexes = [models.Index(fields=['user', 'current'], name='user_program_user_current_idx')]
 
 
 class UserWeight(models.Model):
@@ -124,6 +127,10 @@ class Workout(models.Model):
 
     class Meta:
         db_table = 'workout'
+        indexes = [
+            models.Index(fields=['user', 'expected'], name='workout_user_expected_idx'),
+            models.Index(fields=['user', 'date', 'workout_id'], name='workout_user_date_idx'),
+        ]
 
         
 class Prediction(models.Model):
@@ -138,3 +145,65 @@ class Prediction(models.Model):
     class Meta:
         db_table = 'prediction'
 
+
+class ExerciseSummary(models.Model):
+    summary_id = models.AutoField(primary_key=True)
+    # Covered by the composite indexes below, which all lead with the user.
+    user = models.ForeignKey(WAUser, models.DO_NOTHING, db_index=False)
+    workout = models.ForeignKey(Workout, models.CASCADE)
+    exercise = models.ForeignKey(ExerciseType, models.DO_NOTHING)
+    date = models.DateTimeField(blank=True, null=True)
+    avg_reps = models.FloatField()
+    avg_weight = models.FloatField()
+    avg_rpe = models.FloatField()
+    set_count = models.IntegerField()
+    max_set_num = models.IntegerField()
+    one_rep_max = models.FloatField()
+
+    class Meta:
+        db_table = 'exercise_summary'
+        unique_together = [['user', 'workout', 'exercise']]
+        indexes = [
+            models.Index(fields=['user', 'exercise', 'date'], name='summary_user_exercise_idx'),
+            models.Index(fields=['user', 'date'], name='summary_user_date_idx'),
+        ]
+
+
+class WorkoutSuggestion(models.Model):
+    suggestion_id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(WAUser, models.DO_NOTHING)
+    day = models.ForeignKey(ProgramDay, models.CASCADE)
+    sets = models.JSONField()
+    model_version = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'workout_suggestion'
+        unique_together = [['user', 'day']]
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    job_id = models.AutoField(primary_key=True)
+    task = models.CharField(max_length=45)
+    payload = models.JSONField(default=dict)
+    workout = models.ForeignKey(Workout, models.CASCADE, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'job'
+        indexes = [models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx')]
+
+    def __str__(self):
+        return f'{self.task} #{self.job_id} ({self.status})'
@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .catalog import catalog
+from .models import ExpectedSet, Program, ProgramDay
+from .revisions import bump_revision
+
+EXPECTED_SET_FIELDS = ['exp_set_id', 'day_id', 'exercise_id', 'set_num', 'reps_min', 'rpe', 'reps_max', 'amrap']
+
+# Edits invalidate the tree, the timeout only bounds how long a tree rebuilt from a racing read can outlive one.
+PROGRAM_TREE_TIMEOUT = 60 * 60
+
+
+class ProgramNode(namedtuple('ProgramNode', ['program_id', 'program_name', 'days'])):
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.program_id
+
+    def get_day(self, day_id):
+        for day in self.days:
+            if day.program_day_id == day_id:
+                return day
+        return None
+
+
+class DayNode(namedtuple('DayNode', ['program_day_id', 'day_name', 'program_id', 'sets'])):
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.program_day_id
+
+
+class ExpectedSetNode(namedtuple('ExpectedSetNode', EXPECTED_SET_FIELDS)):
+    __slots__ = ()
+
+    @property
+    def exercise_name(self):
+        # From the catalog rather than the tree, so that a renamed exercise does not wait for the tree to expire.
+        return catalog.get(self.exercise_id).name
+
+
+def program_key(program_id):
+    return f'program_tree:{program_id}'
+
+
+def day_program_key(day_id):
+    return f'program_day_program:{day_id}'
+
+
+def get_program_tree(program_id):
+    """Immutable Program -> ProgramDay -> ExpectedSet tree, cached until the program is edited.
+
+    Returns None for an unknown program.
+    """
+    tree = cache.get(program_key(program_id))
+    if tree is None:
+        tree = build_program_tree(program_id)
+        if tree is not None:
+            cache.set(program_key(program_id), tree, PROGRAM_TREE_TIMEOUT)
+    return tree
+
+
+def get_day_program_id(day_id):
+    """Program id of a program day, or None if it does not exist."""
+    program_id = cache.get(day_program_key(day_id))
+    if program_id is None:
+        program_id = ProgramDay.objects.filter(program_day_id=day_id).values_list('program_id', flat=True).first()
+        if program_id is None:
+            return None
+        # A day never moves to another program.
+        cache.set(day_program_key(day_id), program_id, None)
+    return program_id
+
+
+def get_program_day(day_id):
+    """The DayNode of a program day, or None if it does not exist."""
+    program_id = get_day_program_id(day_id)
+    if program_id is None:
+        return None
+    tree = get_program_tree(program_id)
+    return tree.get_day(day_id) if tree is not None else None
+
+
+def invalidate_program(program_id):
+    cache.delete(program_key(program_id))
+    bump_revision('program', program_id)
+
+
+def build_program_tree(program_id):
+    sets = ExpectedSet.objects.order_by('exp_set_id', 'set_num')
+    days = ProgramDay.objects.order_by('program_day_id') \
+        .prefetch_related(Prefetch('expectedset_set', queryset=sets))
+    program = Program.objects.filter(program_id=program_id) \
+        .prefetch_related(Prefetch('programday_set', queryset=days)).first()
+    if program is None:
+        return None
+    return ProgramNode(program.program_id, program.program_name, tuple(
+        DayNode(day.program_day_id, day.day_name, day.program_id, tuple(
+            ExpectedSetNode(*[getattr(ex_set, field) for field in EXPECTED_SET_FIELDS])
+            for ex_set in day.expectedset_set.all()))
+        for day in program.programday_set.all()))
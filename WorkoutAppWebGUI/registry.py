@@ -0,0 +1,89 @@
+import hashlib
+import io
+import os
+import pickle
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+
+ModelEntry = namedtuple('ModelEntry', ['model', 'stamp', 'digest'])
+
+
+class ModelRegistry:
+    """Process wide store of the trained model artifacts.
+
+    Each named model is loaded once per worker process and shared across
+    requests and threads. .npz files hold a CompiledForest (see forest.py),
+    anything else is a pickle. The file on disk is stat'ed on every lookup and the
+    model is reloaded when its mtime or size change; the swap is a single
+    assignment so readers either see the old or the new model, never a partial
+    one.
+    """
+
+    def __init__(self, paths=None):
+        self._paths = dict(paths or {})
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path):
+        with self._lock:
+            self._paths[name] = path
+            self._entries.pop(name, None)
+
+    def names(self):
+        return list(self._paths)
+
+    def get(self, name):
+        path = self._paths[name]
+        stamp = self._stamp(path)
+        entry = self._entries.get(name)
+        if entry is None or entry.stamp != stamp:
+            entry = self._load(name, path)
+        return entry.model
+
+    def version(self, name):
+        """Content hash of the model currently served under ``name``."""
+        self.get(name)
+        return self._entries[name].digest
+
+    def _load(self, name, path):
+        with self._lock:
+            stamp = self._stamp(path)
+            entry = self._entries.get(name)
+            if entry is not None and entry.stamp == stamp:
+                return entry
+            with open(path, 'rb') as infile:
+                raw = infile.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry is not None and entry.digest == digest:
+                # Touched but unchanged, keep the already unpickled model.
+                entry = entry._replace(stamp=stamp)
+            else:
+                entry = ModelEntry(self._deserialise(path, raw), stamp, digest)
+            self._entries[name] = entry
+            return entry
+
+    @staticmethod
+    def _deserialise(path, raw):
+        if str(path).endswith('.npz'):
+            from .forest import CompiledForest
+            return CompiledForest.load(io.BytesIO(raw))
+        return pickle.loads(raw)
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+
+registry = ModelRegistry(settings.ML_MODELS)
+
+
+def get_model(name=None):
+    return registry.get(name or settings.ML_DEFAULT_MODEL)
+
+
+def get_model_version(name=None):
+    return registry.version(name or settings.ML_DEFAULT_MODEL)
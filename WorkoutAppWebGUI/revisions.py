@@ -0,0 +1,57 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .catalog import catalog as exercise_catalog
+
+# Revisions of everything that shows up on a conditional page (see
+# ConditionalGetMixin in views.py), bumped on writes. They are kept in the
+# default cache, which must be shared by all processes (settings.CACHES) for
+# a write in one of them to reach the others' validators:
+#   program   the program tree and its name: invalidate_program and the Program signals
+#   programs  the list of programs: the Program signals
+#   workout   a workout and its sets: the Workout and Set signals
+#   user      the user's name, current program and groups: the WAUser, UserProgram and group signals
+#   roles     the group names of an auth user (see roles.py): the group signals
+
+
+def revision_key(kind, pk):
+    return f'revision:{kind}:{pk}'
+
+
+def bump_revision(kind, pk=None):
+    cache.set(revision_key(kind, pk), (uuid.uuid4().hex, timezone.now().replace(microsecond=0)), None)
+
+
+def get_revisions(keys):
+    """(stamp, modified) of each (kind, pk) in keys, in one cache round trip.
+
+    A revision missing from the cache (never bumped, evicted or cleared)
+    is started afresh, so a lost counter can only cost a full response,
+    never serve a stale 304.
+    """
+    cache_keys = [revision_key(kind, pk) for kind, pk in keys]
+    found = cache.get_many(cache_keys)
+    revisions = []
+    for key in cache_keys:
+        if key not in found:
+            cache.add(key, (uuid.uuid4().hex, timezone.now().replace(microsecond=0)), None)
+            found[key] = cache.get(key)
+        revisions.append(found[key])
+    return revisions
+
+
+def page_validators(user_id, keys, catalog=False):
+    """ETag and Last-Modified of a page that shows the given revisions to a user.
+
+    catalog=True adds the exercise catalog version, for pages that show
+    exercise names read from the database.
+    """
+    revisions = get_revisions(keys)
+    parts = [str(user_id)] + [stamp for stamp, _ in revisions]
+    if catalog:
+        parts.append(exercise_catalog.version())
+    etag = hashlib.sha1(':'.join(parts).encode()).hexdigest()
+    return etag, max(modified for _, modified in revisions)
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .revisions import get_revisions
+
+ROLES_SESSION_KEY = '_roles'
+
+
+def get_roles(user):
+    """Names of the user's groups, queried once and kept on the user object for the rest of the request."""
+    if not user.is_authenticated:
+        return frozenset()
+    try:
+        return user._roles
+    except AttributeError:
+        pass
+    user._roles = frozenset(user.groups.values_list('name', flat=True))
+    return user._roles
+
+
+def get_request_roles(request):
+    """get_roles() of request.user, also kept in the session when settings.ROLES_SESSION_CACHE is set.
+
+    The session copy is checked against the user's 'roles' revision
+    (bumped by the group signals), so later requests read the roles
+    without the group query until the user's groups change. Reading the
+    revision is a query of its own with the database cache.
+    """
+    user = request.user
+    if not settings.ROLES_SESSION_CACHE or not user.is_authenticated or hasattr(user, '_roles'):
+        return get_roles(user)
+    (stamp, _), = get_revisions([('roles', user.pk)])
+    cached = request.session.get(ROLES_SESSION_KEY)
+    if cached is not None and cached['stamp'] == stamp:
+        user._roles = frozenset(cached['roles'])
+        return user._roles
+    roles = get_roles(user)
+    request.session[ROLES_SESSION_KEY] = {'stamp': stamp, 'roles': sorted(roles)}
+    return roles
+
+
+def has_role(request, name):
+    return name in get_request_roles(request)
+
+
+def roles(request):
+    """Context processor, the user's roles as roles, for {% if 'trainer' in roles %}."""
+    return {'roles': SimpleLazyObject(lambda: get_request_roles(request))}
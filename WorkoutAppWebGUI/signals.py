@@ -0,0 +1,84 @@
+from django.contrib.auth.models import Group, User
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .catalog import catalog
+from .instrumentation import histogram
+from .models import ExerciseType, Program, Set, UserProgram, WAUser, Workout
+from .revisions import bump_revision
+
+
+@receiver([post_save, post_delete], sender=ExerciseType)
+def invalidate_exercise_catalog(sender, **kwargs):
+    catalog.invalidate()
+
+
+@receiver(request_started)
+def start_catalog_request(sender, **kwargs):
+    catalog.start_request()
+
+
+@receiver(request_finished)
+def finish_catalog_request(sender, **kwargs):
+    catalog.finish_request()
+
+
+@receiver(request_finished)
+def publish_stage_histogram(sender, **kwargs):
+    # After the response, only requests that ran a prediction stage write to the cache.
+    histogram.publish()
+
+
+@receiver([post_save, post_delete], sender=Program)
+def bump_program_revisions(sender, instance, **kwargs):
+    bump_revision('program', instance.pk)
+    bump_revision('programs')
+
+
+@receiver([post_save, post_delete], sender=Workout)
+def bump_workout_revision(sender, instance, **kwargs):
+    bump_revision('workout', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Set)
+def bump_set_workout_revision(sender, instance, **kwargs):
+    bump_revision('workout', instance.workout_id)
+
+
+@receiver([post_save, post_delete], sender=WAUser)
+@receiver([post_save, post_delete], sender=UserProgram)
+def bump_user_revision(sender, instance, **kwargs):
+    bump_revision('user', instance.user_id)
+
+
+def bump_member_revisions(auth_user_ids):
+    """The navigation shows trainer links, so pages change with the user's groups, as do the cached roles."""
+    for auth_user_id in auth_user_ids:
+        bump_revision('roles', auth_user_id)
+    for user_id in WAUser.objects.filter(auth_user_id__in=auth_user_ids).values_list('user_id', flat=True):
+        bump_revision('user', user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_group_member_revisions(sender, instance, action, pk_set, **kwargs):
+    if isinstance(instance, User):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        auth_user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        # group.user_set.clear() does not list the members, they are only known before
+        auth_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        auth_user_ids = pk_set
+    else:
+        return
+    bump_member_revisions(auth_user_ids)
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def bump_renamed_group_revisions(sender, instance, created=False, **kwargs):
+    """Renaming or deleting a group changes its members' roles, deleting does not send m2m_changed."""
+    if created:
+        return
+    bump_member_revisions(list(instance.user_set.values_list('pk', flat=True)))
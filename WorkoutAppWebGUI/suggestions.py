@@ -0,0 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import IntegrityError, connections, transaction
+
+from .jobs import enqueue
+from .models import UserProgram, WorkoutSuggestion
+from .programs import get_program_day, get_program_tree
+from .registry import get_model, get_model_version
+
+
+def serialise_sets(sets):
+    """JSON friendly copy of Predictor.predict output."""
+    return [{'exercise': ex_set['exercise'],
+             'weight': int(ex_set['weight']),
+             'order': int(ex_set['order']),
+             'set_number': int(ex_set['set_number']),
+             'reps': int(ex_set['reps']),
+             'RPE': float(ex_set['RPE'])} for ex_set in sets]
+
+
+def get_suggestion(user_id, day_id):
+    """Suggested sets for a user's program day, computed and stored on a miss.
+
+    Stored suggestions stay valid until the user logs a workout, the day's
+    expected sets change (both delete them) or the served model changes.
+    """
+    from .ml import Predictor
+
+    version = get_model_version()
+    sets = WorkoutSuggestion.objects.filter(user_id=user_id, day_id=day_id, model_version=version) \
+        .values_list('sets', flat=True).first()
+    if sets is None:
+        day = get_program_day(day_id)
+        if day is None:
+            return []
+        sets = serialise_sets(Predictor(day, user_id).predict())
+        try:
+            WorkoutSuggestion.objects.update_or_create(user_id=user_id, day_id=day_id,
+                                                       defaults={'sets': sets, 'model_version': version})
+        except IntegrityError:
+            # Stored concurrently by another request or the background refresh.
+            pass
+    return sets
+
+
+def invalidate_user(user_id):
+    """Drop the user's suggestions after a new workout and recompute them in the background."""
+    WorkoutSuggestion.objects.filter(user_id=user_id).delete()
+    refresh_in_background([user_id])
+
+
+def invalidate_day(day_id):
+    """Drop the suggestions of a day whose expected sets changed and recompute them in the background."""
+    WorkoutSuggestion.objects.filter(day_id=day_id).delete()
+    users = UserProgram.objects.filter(current=1, program__programday=day_id).values_list('user_id', flat=True)
+    refresh_in_background(users)
+
+
+def refresh_in_background(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        enqueue('refresh_suggestions', user_ids=user_ids)
+
+
+def predict_users(user_ids, batch_size=5000):
+    """Store suggested sets for every day of the current program of the given users.
+
+    Features of all (user, day) pairs are built first and the model then runs
+    over them batch_size rows at a time. Returns the number of suggestions
+    written.
+    """
+    import numpy
+    import pandas
+    from .ml import Predictor, FEATURE_COLUMNS
+
+    user_programs = list(UserProgram.objects.filter(user_id__in=user_ids, current=1, program__isnull=False)
+                         .values_list('user_id', 'program_id'))
+    predictors = []
+    features = []
+    for user_id, program_id in user_programs:
+        tree = get_program_tree(program_id)
+        for day in tree.days if tree is not None else ():
+            predictor = Predictor(day, user_id)
+            ex_data = predictor.get_features()
+            if ex_data is not None:
+                ex_data['job'] = len(predictors)
+                features.append(ex_data)
+            predictors.append((user_id, day.program_day_id, predictor))
+
+    fitted = {}
+    if features:
+        data = pandas.concat(features, ignore_index=True)
+        model = get_model()
+        data['suggestion'] = numpy.concatenate([model.predict(data[FEATURE_COLUMNS].iloc[start:start + batch_size])
+                                                for start in range(0, len(data), batch_size)])
+        fitted = {job: rows.drop(columns='job') for job, rows in data.groupby('job')}
+
+    version = get_model_version()
+    suggestions = [WorkoutSuggestion(user_id=user_id,
+                                     day_id=day_id,
+                                     sets=serialise_sets(predictor.recommend(fitted.get(job))),
+                                     model_version=version)
+                   for job, (user_id, day_id, predictor) in enumerate(predictors)]
+    with transaction.atomic():
+        WorkoutSuggestion.objects.filter(user_id__in=user_ids).delete()
+        # A request may have stored a fresh suggestion meanwhile, it is as good as ours.
+        WorkoutSuggestion.objects.bulk_create(suggestions, ignore_conflicts=True)
+    return len(suggestions)
+
+
+def run_batch(chunk_size=100, batch_size=5000, workers=1):
+    """Run predict_users over every user with a current program, chunk_size users at a time.
+
+    With workers > 1 the chunks are spread over a process pool.
+    """
+    user_ids = list(UserProgram.objects.filter(current=1).order_by('user_id')
+                    .values_list('user_id', flat=True).distinct())
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+    if workers <= 1:
+        return sum(predict_users(chunk, batch_size) for chunk in chunks)
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return sum(pool.map(predict_users, chunks, [batch_size] * len(chunks)))
@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models import Avg, Count, Max
+
+from .models import ExerciseSummary, Set, Workout
+
+
+def summarise_sets(sets):
+    """Aggregate a Set queryset into unsaved ExerciseSummary rows, one per workout and exercise."""
+    import numpy
+    from .ml import Predictor
+
+    rows = sets.values('workout_id', 'workout__user_id', 'workout__date', 'exercise_id') \
+        .order_by() \
+        .annotate(avg_reps=Avg('reps'), avg_weight=Avg('weight'), avg_rpe=Avg('rpe'),
+                  set_count=Count('set_id'), max_set_num=Max('set_number'))
+    rows = list(rows)
+    avg_reps = numpy.array([row['avg_reps'] for row in rows], dtype='float64')
+    avg_weight = numpy.array([row['avg_weight'] for row in rows], dtype='float64')
+    one_rep_max = Predictor.calculate_one_rep_max(avg_weight, avg_reps)
+    summaries = [ExerciseSummary(user_id=row['workout__user_id'],
+                                 workout_id=row['workout_id'],
+                                 exercise_id=row['exercise_id'],
+                                 date=row['workout__date'],
+                                 avg_reps=float(row['avg_reps']),
+                                 avg_weight=float(row['avg_weight']),
+                                 avg_rpe=float(row['avg_rpe']),
+                                 set_count=row['set_count'],
+                                 max_set_num=row['max_set_num'],
+                                 one_rep_max=float(estimate)) for row, estimate in zip(rows, one_rep_max)]
+    return summaries
+
+
+def refresh_workout_summaries(workout_ids):
+    """Recompute the summary rows of the given workouts from their sets."""
+    workout_ids = list(workout_ids)
+    with transaction.atomic():
+        ExerciseSummary.objects.filter(workout_id__in=workout_ids).delete()
+        ExerciseSummary.objects.bulk_create(summarise_sets(Set.objects.filter(workout_id__in=workout_ids)))
+
+
+def rebuild_summaries(user_ids=None, chunk_size=500):
+    """Rebuild the whole summary table (or that of some users), chunk_size workouts per transaction.
+
+    Returns the number of summary rows written.
+    """
+    workouts = Workout.objects.order_by('workout_id')
+    if user_ids:
+        workouts = workouts.filter(user_id__in=user_ids)
+    return rebuild_workout_summaries(list(workouts.values_list('workout_id', flat=True)), chunk_size)
+
+
+def rebuild_workout_summaries(workout_ids, chunk_size=500):
+    """Rebuild the summary rows of the given workouts, chunk_size workouts per transaction."""
+    written = 0
+    for start in range(0, len(workout_ids), chunk_size):
+        chunk = workout_ids[start:start + chunk_size]
+        with transaction.atomic():
+            ExerciseSummary.objects.filter(workout_id__in=chunk).delete()
+            summaries = summarise_sets(Set.objects.filter(workout_id__in=chunk))
+            ExerciseSummary.objects.bulk_create(summaries, batch_size=chunk_size)
+        written += len(summaries)
+    return written
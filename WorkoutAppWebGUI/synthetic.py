@@ -0,0 +1,102 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .catalog import catalog
+from .models import ExerciseType, Program, ProgramDay, ExpectedSet, WAUser, UserProgram, Workout, Set, UnitType
+from .summary import rebuild_summaries
+
+BATCH_SIZE = 2000
+
+
+def generate_history(users=10, programs=2, years=1, workouts_per_week=3, exercises=30, seed=0, password='synthetic'):
+    """Fill the database with a deterministic synthetic training history.
+
+    Every user runs through `programs` programs over `years` years, logging
+    `workouts_per_week` workouts with the sets of the program day plus a
+    little noise: weights progress slowly, reps wander around the expected
+    range and a few sets are failed outright. Summaries are rebuilt at the end
+    so that the result looks like a database that has been in use.
+
+    Returns the list of created WAUser ids.
+    """
+    rnd = random.Random(seed)
+    prefix = f'synthetic-{seed}-{rnd.getrandbits(32):08x}'
+    unit = UnitType.objects.order_by('unit_id').first() or UnitType.objects.create(label='lbs')
+
+    ExerciseType.objects.bulk_create([ExerciseType(name=f'{prefix} {i}', weighted=rnd.random() > .15,
+                                                   weight_step=rnd.choice([2.5, 5, 10])) for i in range(exercises)])
+    exercise_ids = list(ExerciseType.objects.filter(name__startswith=prefix)
+                        .order_by('exercise_id').values_list('exercise_id', flat=True))
+    # bulk_create skips the signals that keep the catalog current.
+    catalog.invalidate()
+    generated = [generate_program(f'{prefix} program {p}', exercise_ids, rnd) for p in range(programs)]
+
+    password = make_password(password)
+    User.objects.bulk_create([User(username=f'{prefix}-{u}', password=password) for u in range(users)])
+    auth_ids = list(User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+    WAUser.objects.bulk_create([WAUser(auth_user_id=auth_id, first_name='Synthetic', last_name=str(u))
+                                for u, auth_id in enumerate(auth_ids)])
+    user_ids = list(WAUser.objects.filter(auth_user_id__in=auth_ids).order_by('user_id')
+                    .values_list('user_id', flat=True))
+
+    workout_count = int(years * 52 * workouts_per_week)
+    start = timezone.now() - timedelta(days=365 * years)
+    for user_id in user_ids:
+        order = rnd.sample(range(programs), programs)
+        UserProgram.objects.bulk_create([
+            UserProgram(user_id=user_id, program_id=generated[p][0], current=int(i == programs - 1))
+            for i, p in enumerate(order)])
+        strength = {exercise_id: rnd.uniform(40, 200) for exercise_id in exercise_ids}
+        workouts = []
+        for w in range(workout_count):
+            days = generated[order[min(w * programs // workout_count, programs - 1)]][1]
+            day_id, expected_sets = days[w % len(days)]
+            date = start + timedelta(days=w * 7 / workouts_per_week, hours=rnd.uniform(6, 20))
+            workouts.append((day_id if rnd.random() > .05 else None, date, expected_sets))
+        Workout.objects.bulk_create([Workout(user_id=user_id, expected_id=day_id, date=date, complete=1)
+                                     for day_id, date, _ in workouts], batch_size=BATCH_SIZE)
+        workout_ids = Workout.objects.filter(user_id=user_id).order_by('workout_id') \
+            .values_list('workout_id', flat=True)
+        sets = []
+        for workout_id, (_, _, expected_sets) in zip(workout_ids, workouts):
+            for exercise_id, set_num, reps_min, reps_max, rpe in expected_sets:
+                strength[exercise_id] *= rnd.uniform(.995, 1.008)
+                reps = 0 if rnd.random() < .01 else max(1, rnd.randint(reps_min - 1, reps_max + 2))
+                sets.append(Set(workout_id=workout_id, exercise_id=exercise_id, reps=reps,
+                                weight=round(strength[exercise_id]), rpe=min(10, max(5, rpe + rnd.randint(-1, 1))),
+                                set_number=set_num, unit=unit))
+            if len(sets) >= BATCH_SIZE:
+                Set.objects.bulk_create(sets)
+                sets = []
+        Set.objects.bulk_create(sets)
+
+    rebuild_summaries(user_ids)
+    return user_ids
+
+
+def generate_program(name, exercise_ids, rnd):
+    """Create a program of 3 to 5 days.
+
+    Returns (program id, [(day id, [(exercise, set_num, reps_min, reps_max, rpe)])]).
+    """
+    program = Program.objects.create(program_name=name)
+    days = []
+    for d in range(rnd.randint(3, 5)):
+        day = ProgramDay.objects.create(day_name=f'Day {d + 1}', program=program)
+        expected_sets = []
+        for exercise_id in rnd.sample(exercise_ids, min(len(exercise_ids), rnd.randint(4, 6))):
+            reps_min = rnd.choice([3, 5, 6, 8, 10, 12])
+            reps_max = reps_min + rnd.choice([0, 2, 4])
+            rpe = rnd.randint(6, 9)
+            expected_sets.extend((exercise_id, set_num, reps_min, reps_max, rpe)
+                                 for set_num in range(1, rnd.randint(3, 5) + 1))
+        ExpectedSet.objects.bulk_create([ExpectedSet(day=day, exercise_id=exercise_id, set_num=set_num,
+                                                     reps_min=reps_min, reps_max=reps_max, rpe=rpe,
+                                                     amrap=rnd.random() < .1)
+                                         for exercise_id, set_num, reps_min, reps_max, rpe in expected_sets])
+        days.append((day.program_day_id, expected_sets))
+    return program.program_id, days
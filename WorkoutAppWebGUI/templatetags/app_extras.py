@@ -1,8 +1,10 @@
 from django import template
 
+from ..roles import get_roles
+
 register = template.Library()
 
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+    return group_name in get_roles(user)
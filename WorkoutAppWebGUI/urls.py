@@ -8,9 +8,14 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(template_name='WorkoutAppWebGUI/logout.html'), name='logout'),
     # path('reset_password', auth_views.PasswordResetView.as_view(template_name='WorkoutAppWebGUI/reset_password.html'), name='password_reset'),
     path('landing', views.landing, name="landing"),
+    path('history', views.history, name='history'),
+    path('history/workouts', views.history_api, name='history_api'),
+    path('landing/one_rep_max', views.one_rep_max_data, name="one_rep_max_data"),
     path('user/add', views.AddUser.as_view(), name='add_user'),
     path('user/<int:pk>', views.UserView.as_view(), name="profile"),
     path('user/edit', views.edit_user, name="user_edit"),
+    path('user/<int:pk>/export.<str:fmt>', views.export_history, name='export_history'),
+    path('user/<int:pk>/import', views.upload_history, name='import_history'),
     path('user/<int:pk>/program', views.ProgramView.as_view(), name="view_program"),
     path('exercise/new', views.AddExerciseView.as_view(), name='add_exercise'),
     path('exercise/<int:pk>', views.UpdateExerciseView.as_view, name='update_exercise'),
@@ -25,6 +30,7 @@ urlpatterns = [
     path('program/create_day/<int:program_id>', views.ProgramDayCreate.as_view(), name='create_day'),
     path('programs/create', views.CreateProgramView.as_view(), name='create_program'),
     path('programs/<int:program_id>/remove_day/<int:day_id>', views.remove_day, name='day_remove'),
-    path('contact', views.contact, name="contact")
+    path('contact', views.contact, name="contact"),
+    path('instrumentation/stages', views.stage_stats, name='stage_stats'),
 
 ]
\ No newline at end of file
@@ -1,21 +1,69 @@
 from django.shortcuts import render, get_object_or_404, redirect, reverse
 from django.views import generic
-from django.db.models import Avg, Max
+from django.views.decorators.http import condition
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
-from django.utils.timezone import datetime
-from .models import Workout, WAUser, Program, UserWeight, UserProgram, Set, ProgramDay, ExpectedSet, UnitType
-from .models import ExerciseType, Prediction
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.timezone import datetime, make_aware
+from .models import Workout, WAUser, Program, UserWeight, UserProgram, Set, ProgramDay, UnitType
+from .models import ExerciseType, Job
 from .forms import UserWeightForm, UserProgramForm, DaySelectorForm, SetFormSet, ExpectedSetFormset, ProgramDayForm
 from .forms import WorkoutForm, AddUserForm, ExerciseForm, PredictionValidationForm, PredictionFormSet
-from .ml import Predictor, quick_predict
-from bokeh.plotting import figure
-from bokeh.embed import components
-from bokeh.models import Select, CustomJS, ColumnDataSource
-from bokeh.layouts import column
-import pandas
-import numpy
+from .forms import ImportHistoryForm, HistoryFilterForm
+from .summary import refresh_workout_summaries
+from .suggestions import get_suggestion, invalidate_user, invalidate_day
+from .jobs import enqueue
+from .programs import get_program_tree, get_program_day, get_day_program_id, invalidate_program
+from .revisions import page_validators
+from .roles import has_role
+from .charts import append_workout, exercise_menu, exercise_series
+from .charts import get_one_rep_max_chart
+from .instrumentation import histogram
+from .export import FORMATS, stream_history
+from .importer import import_history
+from .history import workout_page, serialise_workout
+from datetime import time, timedelta
+
+
+class ConditionalGetMixin:
+    """Answer GET and HEAD with 304 Not Modified while the revisions shown on the page are unchanged.
+
+    get_revision_keys() lists the (kind, pk) revisions of revisions.py
+    that the page renders, the user's own revision is always included.
+    Validators are computed from cache reads only, a 304 skips the view's
+    queries and the template.
+    """
+    revision_catalog = False
+
+    def get_revision_keys(self):
+        return []
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super(ConditionalGetMixin, self).dispatch
+        if request.method not in ('GET', 'HEAD'):
+            return dispatch(request, *args, **kwargs)
+        keys = [('user', request.user.wauser.pk)] + self.get_revision_keys()
+        etag, last_modified = page_validators(request.user.pk, keys, self.revision_catalog)
+        dispatch = condition(etag_func=lambda *args, **kwargs: etag,
+                             last_modified_func=lambda *args, **kwargs: last_modified)(dispatch)
+        response = dispatch(request, *args, **kwargs)
+        # Pages are per user, and browsers should revalidate on every visit.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class TrainerRequiredMixin(UserPassesTestMixin):
+    """Only for the trainer group, read through roles.py rather than a groups query per check."""
+
+    def test_func(self):
+        return has_role(self.request, 'trainer')
 
 
 def index(request):
@@ -30,6 +78,7 @@ def remove_day(request, *args, **kwargs):
     if request.POST:
         day = ProgramDay.objects.filter(pk=kwargs['day_id'])
         day.delete()
+        invalidate_program(kwargs['program_id'])
 
     return reverse('program_day_list', kwargs={'pk': kwargs['program_id']})
 
@@ -38,43 +87,132 @@ def remove_day(request, *args, **kwargs):
 def landing(request):
     context = {}
     user = get_object_or_404(WAUser, pk=request.user.wauser.pk)
-    context['exercise_history'] = user.workout_set.order_by('-workout_id')[:10][::-1]
-    data = Set.objects.filter(workout__in=user.workout_set.all()).values('workout__date', 'exercise__name').\
-        order_by("workout__date").annotate(avg_reps=Avg('reps'), avg_weight=Avg('weight'))
-    context['script'], context['div'] = plot(data)
+    context['exercise_history'] = user.workout_set.select_related('expected').order_by('-workout_id')[:10][::-1]
+    context['script'], context['div'] = get_one_rep_max_chart(user.pk, plot)
     return render(request, "WorkoutAppWebGUI/landing.html", context)
 
 
+@login_required()
+def one_rep_max_data(request):
+    user = get_object_or_404(WAUser, pk=request.user.wauser.pk)
+    try:
+        exercise_id = int(request.GET['exercise'])
+        start = parse_day(request.GET.get('start'))
+        end = parse_day(request.GET.get('end'))
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('exercise must be an id, start and end dates as YYYY-MM-DD')
+    if end is not None:
+        end += timedelta(days=1)
+    return JsonResponse(exercise_series(user.pk, exercise_id, start, end))
+
+
+def history_page(request):
+    """Filter form and page of workouts of the history views, the page is None when the form is invalid."""
+    user_id = request.user.wauser.pk
+    days = ProgramDay.objects.filter(program__userprogram__user_id=user_id).select_related('program') \
+        .order_by('program__program_name', 'program_day_id').distinct()
+    form = HistoryFilterForm(request.GET, days=days)
+    if not form.is_valid():
+        return form, None, None
+    data = form.cleaned_data
+    workouts, cursor = workout_page(user_id, data['after'], data['day'], data['exercise'], data['size'])
+    return form, workouts, cursor
+
+
+@login_required()
+def history(request):
+    form, workouts, cursor = history_page(request)
+    context = {'form': form, 'workouts': workouts}
+    query = request.GET.copy()
+    if query.pop('after', None):
+        context['first_query'] = query.urlencode()
+    if cursor is not None:
+        query['after'] = cursor
+        context['next_query'] = query.urlencode()
+    return render(request, 'WorkoutAppWebGUI/history.html', context)
+
+
+@login_required()
+def history_api(request):
+    form, workouts, cursor = history_page(request)
+    if workouts is None:
+        return JsonResponse({'errors': form.errors}, status=400)
+    return JsonResponse({'workouts': [serialise_workout(workout) for workout in workouts], 'next': cursor})
+
+
+@login_required()
+def export_history(request, pk, fmt):
+    """Stream a user's full history, their own or any user's for trainers."""
+    if fmt not in FORMATS:
+        raise Http404(f'Unknown export format {fmt}')
+    check_user_access(request, pk)
+    user = get_object_or_404(WAUser, pk=pk)
+    response = StreamingHttpResponse(stream_history(user.pk, fmt), content_type=FORMATS[fmt][1])
+    response['Content-Disposition'] = f'attachment; filename="workout-history-{user.pk}.{fmt}"'
+    return response
+
+
+@login_required()
+def upload_history(request, pk):
+    """Bulk import of a history file into a user's workouts, their own or any user's for trainers."""
+    check_user_access(request, pk)
+    user = get_object_or_404(WAUser, pk=pk)
+    result = None
+    if request.method == 'POST':
+        form = ImportHistoryForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = import_history(user.pk, form.cleaned_data['file'], form.cleaned_data['format'])
+    else:
+        form = ImportHistoryForm()
+    return render(request, 'WorkoutAppWebGUI/import_history.html', {'form': form, 'user_data': user, 'result': result})
+
+
+def check_user_access(request, pk):
+    if pk != request.user.wauser.pk and not has_role(request, 'trainer'):
+        raise PermissionDenied
+
+
+@staff_member_required
+def stage_stats(request):
+    """Prediction pipeline stage histogram, merged over the processes that published theirs."""
+    if request.GET.get('reset'):
+        histogram.reset_shared()
+    return JsonResponse(histogram.shared_snapshot())
+
+
+def parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    day = datetime.combine(day, time.min)
+    return make_aware(day) if settings.USE_TZ else day
+
+
 def plot(input_data):
-    df = pandas.DataFrame(input_data)
-    df['one-rep-max'] = df.apply(calculate_one_rep_max, axis=1)
-    df = df.drop(['avg_reps', 'avg_weight'], axis=1)
-    df['workout__date'] = pandas.to_datetime(df.workout__date)
-    df = df.set_index(keys='workout__date')
-    data = ColumnDataSource(data=df)
-    menu = list(df.exercise__name.unique())
-    cur_data = ColumnDataSource(data=dict(x=[], y=[], z=[]))
-    callback = CustomJS(args=dict(source=data, ss=cur_data), code="""
+    # bokeh is only needed here, keep it out of the worker's import time.
+    from bokeh.plotting import figure
+    from bokeh.embed import components
+    from bokeh.models import Select, CustomJS, ColumnDataSource
+    from bokeh.layouts import column
+
+    menu = exercise_menu(input_data)
+    cur_data = ColumnDataSource(data=dict(x=[], y=[]))
+    fig = figure(title="Estimated One Rep Max", x_axis_label="Date", x_axis_type='datetime',
+                 y_axis_label="Estimated One Rep Max")
+    callback = CustomJS(args=dict(ss=cur_data, fig=fig, url=reverse('one_rep_max_data')), code="""
         var f = cb_obj.value
-        var d2 = ss.data
-        d2['x'] = []
-        d2['y'] = []
-        d2['z'] = []
-        
-        for(var i = 0; i <= source.get_length(); i++){
-            if (source.data['exercise__name'][i] == f){
-                d2['x'].push(source.data['workout__date'][i])
-                d2['y'].push(source.data['one-rep-max'][i])
-                d2['z'].push(source.data['exercise__name'][i])
-            }
-        }
-        ss.change.emit();
+        var label = cb_obj.options.find(function(option) { return option[0] == f })
+        fetch(url + '?exercise=' + encodeURIComponent(f), {credentials: 'same-origin'})
+            .then(function(response) { return response.json() })
+            .then(function(series) {
+                ss.data = {x: series.x, y: series.y}
+                fig.title.text = 'Estimated One Rep Max - ' + (label ? label[1] : '')
+            })
         """)
     exercise_chooser = Select(title="Exercise", options=menu)
     exercise_chooser.sizing_mode = 'scale_width'
-    exercise = '' if cur_data.data['z'] == [] else cur_data.data['z'][0]
-    fig = figure(title=f"Estimated One Rep Max - {exercise}", x_axis_label="Date", x_axis_type='datetime',
-                 y_axis_label="Estimated One Rep Max")
     fig.sizing_mode = "scale_both"
     fig.line(x='x', y='y', source=cur_data)
     exercise_chooser.js_on_change("value", callback)
@@ -84,12 +222,6 @@ def plot(input_data):
     return script, div
 
 
-def calculate_one_rep_max(row):
-    numerator = 100 * row['avg_weight']
-    denominator = 48.8 + (53.8 * numpy.exp(-0.075 * row['avg_reps']))
-    return float(numerator) / float(denominator)
-
-
 @login_required()
 def edit_user(request):
     user = get_object_or_404(WAUser, pk=request.user.wauser.pk)
@@ -107,8 +239,8 @@ def choose_day(request):
     user = get_object_or_404(WAUser, pk=request.user.wauser.pk)
     form = DaySelectorForm
     user_program = UserProgram.objects.filter(user_id=user.pk).filter(current=1).first()
-    days = user_program.program.programday_set.all()
-    choices = [((day.program.program_id, day.day_name), day.day_name) for day in days]
+    program = get_program_tree(user_program.program_id)
+    choices = [((day.program_id, day.day_name), day.day_name) for day in program.days]
     choices.insert(0, ((None, "Different Workout"), "Different Workout"))
     form.declared_fields['day_selector'].choices = choices
     if request.GET:
@@ -117,28 +249,13 @@ def choose_day(request):
         program_id = int(temp[0])
         day_name = temp[1][1:-1]
         if day_name != "Different Workout":
-            day = ProgramDay.objects.filter(program_id=program_id).filter(day_name=day_name).first()
+            day = next(day for day in get_program_tree(program_id).days if day.day_name == day_name)
             return redirect('add_workout', day_id=day.program_day_id)
         else:
             context = {}
             return render(request, '', context)
     return render(request, "WorkoutAppWebGUI/day_selector.html", {'form': form,
-                                                                  'program': user_program.program.program_name})
-
-
-def populate_predictions(pk):
-    data = Workout.objects.get(workout_id=pk) \
-        .set_set.values('exercise_id') \
-        .annotate(avg_reps=Avg('reps'), avg_rpe=Avg('rpe'), )
-    suggestion = quick_predict(pk)
-    for row in data:
-        recommendation = suggestion.loc[suggestion['exercise_id'] == row['exercise_id'], 'suggestion'].values[0]
-        pred = Prediction(workout_id=Workout.objects.filter(workout_id=pk).first(),
-                          exercise=ExerciseType.objects.filter(exercise_id=row['exercise_id']).first(),
-                          avg_reps=row['avg_reps'],
-                          avg_rpe=row['avg_rpe'],
-                          recommendation=recommendation)
-        pred.save()
+                                                                  'program': program.program_name})
 
 
 class UserView(LoginRequiredMixin, generic.DetailView):
@@ -179,27 +296,35 @@ class AddUser(LoginRequiredMixin, generic.edit.CreateView):
         return reverse('landing')
 
 
-class ProgramView(LoginRequiredMixin, generic.DetailView):
+class ProgramView(LoginRequiredMixin, ConditionalGetMixin, generic.DetailView):
     model = UserProgram
     template_name = 'WorkoutAppWebGUI/program.html'
     login_url = 'login/'
     redirect_field_name = ''
+    revision_catalog = True
+
+    def get_revision_keys(self):
+        program_id = UserProgram.objects.filter(user_id=self.request.user.wauser.pk, current=1) \
+            .values_list('program_id', flat=True).first()
+        return [('program', program_id)]
 
     def get_context_data(self, **kwargs):
         context = super(ProgramView, self).get_context_data(**kwargs)
         program = UserProgram.objects.filter(user_id=self.request.user.wauser.pk).filter(current=1).first()
-        context['program'] = program.program
-        program_days = program.program.programday_set.all()
-        context['program_days'] = {program_day.day_name:
-                                       program_day.expectedset_set.all() for program_day in program_days}
+        context['program'] = get_program_tree(program.program_id)
+        context['program_days'] = {program_day.day_name: program_day.sets for program_day in context['program'].days}
         return context
 
 
-class WorkoutView(LoginRequiredMixin, generic.DetailView):
+class WorkoutView(LoginRequiredMixin, ConditionalGetMixin, generic.DetailView):
     model = Workout
     template_name = "WorkoutAppWebGUI/workout_detail.html"
     login_url = 'login/'
     redirect_field_name = ''
+    revision_catalog = True
+
+    def get_revision_keys(self):
+        return [('workout', self.kwargs['pk'])]
 
     def get_queryset(self):
         query_set = super(WorkoutView, self).get_queryset().filter(user_id=self.request.user.wauser.pk)
@@ -207,7 +332,7 @@ class WorkoutView(LoginRequiredMixin, generic.DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(WorkoutView, self).get_context_data(**kwargs)
-        context['data'] = Workout.objects.get(workout_id=self.kwargs['pk']).set_set.all()
+        context['data'] = self.object.set_set.select_related('exercise', 'unit')
         return context
 
 
@@ -228,12 +353,10 @@ class AddWorkoutView(LoginRequiredMixin, generic.CreateView):
     def get_context_data(self, **kwargs):
         data = super(AddWorkoutView, self).get_context_data(**kwargs)
         data['day'] = ProgramDay.objects.filter(program_day_id=self.kwargs['day_id']).first()
-        day = ExpectedSet.objects.filter(day_id=self.kwargs['day_id']).order_by('exp_set_id', 'set_num').all()
         if self.request.POST:
             data['sets'] = SetFormSet(self.request.POST)
         else:
-            pred = Predictor(day, self.request.user.wauser.pk)
-            suggestion = pred.predict()
+            suggestion = get_suggestion(self.request.user.wauser.pk, self.kwargs['day_id'])
             data['sets'] = SetFormSet(initial=suggestion)
             data['sets'].extra = len(suggestion)
         return data
@@ -242,33 +365,40 @@ class AddWorkoutView(LoginRequiredMixin, generic.CreateView):
         context = self.get_context_data()
         sets = context['sets']
         form = context['form']
-        if form.is_valid():
-            instance = form.save(commit=False)
-            instance.complete = 1
-            instance.user_id = self.request.user.wauser.pk
-            instance.expected = context['day']
-            instance.save()
-            self.pk = instance.pk
-            i = 1
-            old_exercise = 0
-            for set_instance in sets:
-                if set_instance.is_valid():
-                    ex_set = set_instance.save(commit=False)
-                    if ex_set.reps == 0:
-                        continue
-                    current_ex = ex_set.exercise_id
-                    if old_exercise != current_ex:
-                        i = 1
-                    ex_set.set_number = i
-                    ex_set.workout_id = instance.pk
-                    ex_set.unit = UnitType.objects.filter(label='lbs').first()
-                    ex_set.save()
-                    old_exercise = current_ex
-                    i += 1
-        return super().form_valid(form)
+        with transaction.atomic():
+            if form.is_valid():
+                instance = form.save(commit=False)
+                instance.complete = 1
+                instance.user_id = self.request.user.wauser.pk
+                instance.expected = context['day']
+                instance.save()
+                self.pk = instance.pk
+                unit = UnitType.objects.filter(label='lbs').first()
+                new_sets = []
+                i = 1
+                old_exercise = 0
+                for set_instance in sets:
+                    if set_instance.is_valid():
+                        ex_set = set_instance.save(commit=False)
+                        if ex_set.reps == 0:
+                            continue
+                        current_ex = ex_set.exercise_id
+                        if old_exercise != current_ex:
+                            i = 1
+                        ex_set.set_number = i
+                        ex_set.workout_id = instance.pk
+                        ex_set.unit = unit
+                        new_sets.append(ex_set)
+                        old_exercise = current_ex
+                        i += 1
+                Set.objects.bulk_create(new_sets)
+                refresh_workout_summaries([instance.pk])
+                invalidate_user(instance.user_id)
+                enqueue('populate_predictions', workout=instance, pk=instance.pk)
+                transaction.on_commit(lambda: append_workout(instance.user_id, instance.pk))
+            return super().form_valid(form)
 
     def get_success_url(self):
-        populate_predictions(self.pk)
         return reverse('validate_prediction', kwargs={'pk': self.pk})
 
 
@@ -289,6 +419,9 @@ class ValidatePredictionView(LoginRequiredMixin, generic.UpdateView):
             data['predictions'] = PredictionFormSet(self.request.POST, instance=self.object)
         else:
             data['predictions'] = PredictionFormSet(instance=self.object)
+        jobs = Job.objects.filter(workout=self.object, task='populate_predictions')
+        data['pending'] = jobs.filter(status__in=[Job.PENDING, Job.RUNNING]).exists()
+        data['failed'] = not data['pending'] and jobs.filter(status=Job.FAILED).exists()
         return data
 
     def form_valid(self, form):
@@ -312,28 +445,28 @@ class ValidatePredictionView(LoginRequiredMixin, generic.UpdateView):
         return reverse('landing')
 
 
-class CreateProgramView(LoginRequiredMixin, UserPassesTestMixin, generic.CreateView):
+class CreateProgramView(LoginRequiredMixin, TrainerRequiredMixin, generic.CreateView):
     model = Program
     fields = ['program_name']
     template_name = 'WorkoutAppWebGUI/add_program.html'
     login_url = 'login/'
     redirect_field_name = ''
 
-    def test_func(self):
-        return self.request.user.groups.all()[0].name == 'trainer'
-
     def get_success_url(self):
         return reverse('program_day_list', kwargs={'pk': self.object.pk})
 
 
-class ProgramListView(LoginRequiredMixin, UserPassesTestMixin, generic.ListView):
+class ProgramListView(LoginRequiredMixin, TrainerRequiredMixin, ConditionalGetMixin, generic.ListView):
     model = Program
     template_name = 'WorkoutAppWebGUI/program_list.html'
     login_url = 'login/'
     redirect_field_name = ''
 
+    def get_revision_keys(self):
+        return [('programs', None)]
+
     def get_queryset(self):
-        if not self.request.user.groups.all()[0].name == 'trainer':
+        if not has_role(self.request, 'trainer'):
             queryset = super(ProgramListView, self).get_queryset().filter(user_id=self.request.user.wauser.pk)
         else:
             queryset = super(ProgramListView, self).get_queryset().all()
@@ -345,9 +478,6 @@ class ProgramListView(LoginRequiredMixin, UserPassesTestMixin, generic.ListView)
         context['program_list'] = Program.objects.all()
         return context
 
-    def test_func(self):
-        return self.request.user.groups.all()[0].name == 'trainer'
-
 
 class ProgramDayListView(LoginRequiredMixin, generic.ListView):
     model = ProgramDay
@@ -356,7 +486,7 @@ class ProgramDayListView(LoginRequiredMixin, generic.ListView):
     redirect_field_name = ''
 
     def get_queryset(self):
-        if not self.request.user.groups.all()[0].name == 'trainer':
+        if not has_role(self.request, 'trainer'):
             queryset = super(ProgramDayListView, self).get_queryset().filter(user_id=self.request.user.wauser.pk)
         else:
             queryset = super(ProgramDayListView, self).get_queryset().all()
@@ -364,39 +494,37 @@ class ProgramDayListView(LoginRequiredMixin, generic.ListView):
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(ProgramDayListView, self).get_context_data(**kwargs)
-        program = Program.objects.filter(program_id=self.kwargs['pk']).first()
+        program = get_program_tree(self.kwargs['pk'])
         context['program'] = program
-        context['days'] = ProgramDay.objects.filter(program_id=self.kwargs['pk']).all()
+        context['days'] = program.days if program is not None else ()
         return context
 
-    def test_func(self):
-        return self.request.user.groups.all()[0].name == 'trainer'
-
 
-class ProgramDayDetailView(LoginRequiredMixin, generic.DetailView):
+class ProgramDayDetailView(LoginRequiredMixin, ConditionalGetMixin, generic.DetailView):
     model = ProgramDay
     template_name = 'WorkoutAppWebGUI/day_detail.html'
     login_url = 'login/'
     redirect_field_name = ''
+    revision_catalog = True
+
+    def get_revision_keys(self):
+        return [('program', get_day_program_id(self.kwargs['pk']))]
 
     def get_context_data(self, **kwargs):
         context = super(ProgramDayDetailView, self).get_context_data(**kwargs)
-        context['set_list'] = ExpectedSet.objects.filter(day_id=self.kwargs['pk'])
-        day = ProgramDay.objects.filter(program_day_id=self.kwargs['pk']).values('day_name').first()
-        context['day_name'] = day['day_name']
+        day = get_program_day(self.kwargs['pk'])
+        context['set_list'] = day.sets
+        context['day_name'] = day.day_name
         return context
 
 
-class ProgramDayUpdate(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateView):
+class ProgramDayUpdate(LoginRequiredMixin, TrainerRequiredMixin, generic.UpdateView):
     model = ProgramDay
     form_class = ProgramDayForm
     template_name = 'WorkoutAppWebGUI/create_day.html'
     login_url = 'login/'
     redirect_field_name = ''
 
-    def test_func(self):
-        return self.request.user.groups.all()[0].name == 'trainer'
-
     def get_context_data(self, **kwargs):
         context = super(ProgramDayUpdate, self).get_context_data(**kwargs)
         if self.request.POST:
@@ -429,22 +557,23 @@ class ProgramDayUpdate(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateVi
                     ex_set.save()
                     old_exercise = current_ex
                     i += 1
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Only once the day itself is saved, a tree rebuilt in between would keep the old day name.
+        transaction.on_commit(lambda: invalidate_program(self.object.program_id))
+        transaction.on_commit(lambda: invalidate_day(self.object.pk))
+        return response
 
     def get_success_url(self):
         return reverse('program_list')
 
 
-class ProgramDayCreate(LoginRequiredMixin, UserPassesTestMixin, generic.CreateView):
+class ProgramDayCreate(LoginRequiredMixin, TrainerRequiredMixin, generic.CreateView):
     model = ProgramDay
     form_class = ProgramDayForm
     template_name = 'WorkoutAppWebGUI/create_day.html'
     login_url = 'login/'
     redirect_field_name = ''
 
-    def test_func(self):
-        return self.request.user.groups.all()[0].name == 'trainer'
-
     def get_context_data(self, **kwargs):
         context = super(ProgramDayCreate, self).get_context_data(**kwargs)
         context['program'] = Program.objects.filter(pk=self.kwargs['program_id']).first()
@@ -480,7 +609,11 @@ class ProgramDayCreate(LoginRequiredMixin, UserPassesTestMixin, generic.CreateVi
                     ex_set.save()
                     old_exercise = current_ex
                     i += 1
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Only once the day itself is saved, a tree rebuilt in between would keep the old day name.
+        transaction.on_commit(lambda: invalidate_program(self.object.program_id))
+        transaction.on_commit(lambda: invalidate_day(self.object.pk))
+        return response
 
     def get_success_url(self):
         return reverse('program_day_list', kwargs={'pk': self.kwargs['program_id']})
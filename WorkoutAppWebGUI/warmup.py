@@ -0,0 +1,28 @@
+import importlib
+
+from .registry import get_model
+
+# Modules that import pandas, numpy and bokeh, which the views only load on first use.
+HEAVY_MODULES = [
+    'numpy',
+    'pandas',
+    'bokeh.embed',
+    'bokeh.layouts',
+    'bokeh.models',
+    'bokeh.plotting',
+    'WorkoutAppWebGUI.forest',
+    'WorkoutAppWebGUI.ml',
+]
+
+
+def warm_up():
+    """Import the heavy libraries and load the default model.
+
+    Meant for the gunicorn master with preload_app (see gunicorn.conf.py), so
+    forked workers share the pages instead of each paying for them on their
+    first prediction or chart. Does not touch the database: connections must
+    not be opened before forking.
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    get_model()
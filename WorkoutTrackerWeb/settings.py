@@ -47,12 +47,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'WorkoutAppWebGUI',
+    'WorkoutAppWebGUI.apps.WorkoutappwebguiConfig',
     'crispy_forms',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'WorkoutAppWebGUI.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'WorkoutAppWebGUI.roles.roles',
             ],
         },
     },
@@ -99,6 +101,34 @@ DATABASES = {
 db_from_env = dj_database_url.config(default=DATABASE_URL, conn_max_age=500)
 DATABASES['default'].update(db_from_env)
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# CACHE_BACKEND picks the backend, CACHE_LOCATION overrides its default location. The catalog version, program
+# trees, revision stamps and chart caches must be shared by every web worker and the job worker, which the
+# database cache (the default, its table is made by createcachetable) and memcached are. The file backend is
+# only shared within a host and local memory only within a process, use them for development. memcached needs
+# the python-memcached package.
+
+CACHE_BACKENDS = {
+    'database': ('django.core.cache.backends.db.DatabaseCache', 'workout_tracker_cache', {'MAX_ENTRIES': 20000}),
+    'memcached': ('django.core.cache.backends.memcached.MemcachedCache', '127.0.0.1:11211', {}),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', '/tmp/workout-tracker-cache', {}),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'workout-tracker', {}),
+}
+CACHE_BACKEND, CACHE_LOCATION, CACHE_OPTIONS = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'database')]
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_LOCATION),
+        'OPTIONS': CACHE_OPTIONS,
+    }
+}
+
+# Keep the user's group names in the session between requests (see roles.py). The copy is checked against a
+# revision stamp in the cache, so it only saves a query with memcached. With the default database cache reading the
+# stamp is a query too, as many as the group query it replaces, and a process local cache would miss group changes.
+ROLES_SESSION_CACHE = os.environ.get('ROLES_SESSION_CACHE', 'False') == 'True'
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -144,3 +174,58 @@ CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Machine Learning Models
+# RFCModel.npz is compiled from RFCModel.pkl with `manage.py compile_forest`
+ML_MODELS = {
+    'RFCModel': BASE_DIR / 'RFCModel.npz',
+    'SVCModel': BASE_DIR / 'SVCModel.pkl',
+}
+ML_DEFAULT_MODEL = 'RFCModel'
+
+# Query budgets per URL name ('POST <name>' for a method specific one), see WorkoutAppWebGUI/middleware.py
+# Budgets hold with empty caches, reads and writes of the database cache (see CACHES) are queries too.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {
+    'index': 4,
+    'login': 4,
+    'logout': 4,
+    'contact': 4,
+    'landing': 20,
+    'one_rep_max_data': 5,
+    'history': 8,
+    'history_api': 7,
+    'add_user': 5,
+    'POST add_user': 11,
+    'profile': 10,
+    # The export body streams after the middleware returns, only the view's own queries count.
+    'export_history': 6,
+    'import_history': 6,
+    # Bulk inserts, grows with the size of the upload.
+    'POST import_history': None,
+    'user_edit': 8,
+    'POST user_edit': 11,
+    'view_program': 31,
+    'add_exercise': 5,
+    'update_exercise': 6,
+    'view_workout': 20,
+    'choose_day': 15,
+    'add_workout': 31,
+    'POST add_workout': 30,
+    'validate_prediction': 15,
+    # Saving the predictions takes four queries per exercise.
+    'POST validate_prediction': 32,
+    'program_list': 18,
+    'program_day_list': 13,
+    'day_detail': 37,
+    'day_update': 8,
+    # Validating and saving the expected sets takes two queries per set.
+    'POST day_update': 46,
+    'create_day': 7,
+    # Saving the expected sets takes a query per set.
+    'POST create_day': 14,
+    'create_program': 5,
+    'POST create_program': 15,
+    'day_remove': 6,
+    'stage_stats': 4,
+}
@@ -0,0 +1,17 @@
+import gc
+import os
+
+# GUNICORN_PRELOAD=True loads the application in the master and warms it up
+# before forking, workers then boot instantly and share the libraries and the
+# model copy-on-write. Code changes then need a full restart, HUP is not enough.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'False') == 'True'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from WorkoutAppWebGUI.warmup import warm_up
+    warm_up()
+    # Keep the warmed objects out of the collector so it does not touch (and copy) their pages in the workers.
+    gc.freeze()
+    server.log.info('Warmed up application in master before forking workers')